@@ -1,7 +1,14 @@
+from Core.Exceptions import SimulationException
 from enum import Enum
+import hashlib
 import random
 import ast
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 """
     Distribution Module
 
@@ -10,6 +17,23 @@ import ast
     - Allow to set seed globally.
     - Eases to change underlying generator.
 
+    Two backends are supported: Python random module (default) and NumPy, where 
+    variates are drawn in large blocks and handed out from a buffer (requires NumPy).
+
+    Each generator is an independent stream identified by its name. Seed of the stream is
+    derived by hashing (seed, run, stream name), so that given (seed, run, stream) always
+    yields the same sequence, regardless of which process executes the run or how many
+    runs are executed in parallel.
+
+    Variance reduction (for comparison of scenarios):
+    - COMMON_RANDOM_NUMBERS: each patient draws all its variates from its own dedicated 
+      substream, so scenarios that differ only in unit counts see exactly the same patients.
+    - ANTITHETIC: as above, but runs are simulated in pairs, where the second run of a pair
+      uses antithetic variates (1 - U) of the first run. Number of runs is rounded up to
+      whole pairs and samples of a pair are pooled before confidence intervals are computed.
+
+    Variance reduction is supported only with Python backend.
+
 """
 
 class Distribution(Enum):
@@ -17,29 +41,145 @@ class Distribution(Enum):
     UNIFORM     = 1
 
 
+class RandomBackend(Enum):
+    PYTHON = 0,
+    NUMPY  = 1
+
+
+class VarianceReduction(Enum):
+    NONE                  = 0,
+    COMMON_RANDOM_NUMBERS = 1,
+    ANTITHETIC            = 2
+
+
 class RandomGenerator:
     """
         Singleton class to control random number generation. Makes parameterized seed
-        globally available between individual random number generators.
+        and run globally available between individual random number generators (streams).
     """
     __instance = None
     
-    def __new__(cls, seed):
+    def __new__(cls, seed, run=0, backend=RandomBackend.PYTHON, reduction=VarianceReduction.NONE):
         """
             Creates singleton instance (first call only).
         """
         if RandomGenerator.__instance is None:
             RandomGenerator.__instance = object.__new__(cls)
+        if backend is RandomBackend.NUMPY and numpy is None:
+            raise SimulationException("NumPy is required for random backend {}.".format(backend.name))
+        if backend is RandomBackend.NUMPY and reduction is not VarianceReduction.NONE:
+            raise SimulationException("Variance reduction {} is supported only with random backend PYTHON.".format(reduction.name))
         RandomGenerator.__instance.__seed = seed
+        RandomGenerator.__instance.__run = run
+        RandomGenerator.__instance.__backend = backend
+        RandomGenerator.__instance.__patient_streams = None
+        if reduction is VarianceReduction.ANTITHETIC:
+            RandomGenerator.__instance.__patient_streams = PatientStreams(seed, run // 2, run % 2 == 1)
+        elif reduction is VarianceReduction.COMMON_RANDOM_NUMBERS:
+            RandomGenerator.__instance.__patient_streams = PatientStreams(seed, run, False)
         return RandomGenerator.__instance
 
 
     @staticmethod
-    def new_generator():
+    def _swap(instance):
+        """
+            Replaces singleton instance with <instance> (None to create a new one on the next call). Returns replaced instance.
+        """
+        previous = RandomGenerator.__instance
+        RandomGenerator.__instance = instance
+        return previous
+
+
+    @staticmethod
+    def new_generator(stream):
         """
-            Create new RNG.
+            Create new RNG for independent stream named <stream>.
         """
-        return random.Random(RandomGenerator.__instance.__seed)
+        if RandomGenerator.__instance.__patient_streams is not None:
+            return RandomGenerator.__instance.__patient_streams
+        seed = RandomGenerator.get_stream_seed(RandomGenerator.__instance.__seed, RandomGenerator.__instance.__run, stream)
+        if RandomGenerator.__instance.__backend is RandomBackend.NUMPY:
+            return BufferedGenerator(seed)
+        return random.Random(seed)
+
+
+    @staticmethod
+    def next_patient():
+        """
+            Moves per-patient substreams to the next patient. NOTE: needs to be called before 
+            drawing variates of a new patient (no effect without variance reduction).
+        """
+        if RandomGenerator.__instance.__patient_streams is not None:
+            RandomGenerator.__instance.__patient_streams.next_patient()
+
+
+    @staticmethod
+    def get_stream_seed(seed, run, stream):
+        """
+            Derives 128-bit seed for stream named <stream> of run <run>.
+        """
+        key = "{}/{}/{}".format(seed, run, stream).encode()
+        return int.from_bytes(hashlib.sha256(key).digest()[:16], "little")
+
+
+class AntitheticRandom(random.Random):
+    """
+        Python RNG producing antithetic variates (1 - U) of random.Random with the same seed.
+    """
+    def random(self):
+        return 1.0 - super().random()
+
+
+class PatientStreams:
+    """
+        Dedicated substream for each patient. All named streams draw from the substream of
+        the current patient (see RandomGenerator.next_patient).
+    """
+
+    def __init__(self, seed, run, antithetic):
+        self.__seed = seed
+        self.__run = run
+        self.__type = AntitheticRandom if antithetic else random.Random
+        self.__patient = -1
+
+    def next_patient(self):
+        self.__patient += 1
+        generator = self.__type(RandomGenerator.get_stream_seed(self.__seed, self.__run, "patient-{}".format(self.__patient)))
+        self.uniform = generator.uniform
+        self.expovariate = generator.expovariate
+
+
+class BufferedGenerator:
+    """
+        RNG that draws standard variates in blocks from NumPy generator and hands them out 
+        from a buffer. Provides the same uniform() and expovariate() methods as random.Random.
+    """
+    BLOCK_SIZE = 8192
+
+    def __init__(self, seed):
+        self.__generator = numpy.random.default_rng(seed)
+        self.__uniforms = iter(())
+        self.__exponentials = iter(())
+
+    def random(self):
+        """
+            Gets next uniform variate from [0, 1).
+        """
+        try:
+            return next(self.__uniforms)
+        except StopIteration:
+            self.__uniforms = iter(self.__generator.random(BufferedGenerator.BLOCK_SIZE).tolist())
+            return next(self.__uniforms)
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def expovariate(self, lambd):
+        try:
+            return next(self.__exponentials) / lambd
+        except StopIteration:
+            self.__exponentials = iter(self.__generator.standard_exponential(BufferedGenerator.BLOCK_SIZE).tolist())
+            return next(self.__exponentials) / lambd
 
 
 class Rng:
@@ -51,6 +191,7 @@ class Rng:
     def __init__(self, string):
         args = ast.literal_eval(string)
         distribution = Distribution[args[0]]
+        self.__args = [distribution.name] + [float(a) for a in args[1:]]
         self.__rng = None
         if Distribution[args[0]] is Distribution.EXPONENTIAL:
             self.__next = self.__get_exponential
@@ -60,12 +201,31 @@ class Rng:
             self.__min = float(args[1])
             self.__max = float(args[2])
 
-    def initialize(self):
+    def __repr__(self):
+        return '["{}", {}]'.format(self.__args[0], ", ".join(map(str, self.__args[1:])))
+
+    def get_mean(self):
+        """
+            Returns mean of the distribution.
+        """
+        if self.__args[0] == Distribution.EXPONENTIAL.name:
+            return self.__args[1]
+        return (self.__args[1] + self.__args[2]) / 2.0
+
+    def get_variance(self):
+        """
+            Returns variance of the distribution.
+        """
+        if self.__args[0] == Distribution.EXPONENTIAL.name:
+            return self.__args[1] ** 2
+        return (self.__args[2] - self.__args[1]) ** 2 / 12.0
+
+    def initialize(self, stream):
         """
-            Initializes the generator. NOTE: Needs to be called before
-            calling next().
+            Initializes the generator for stream named <stream>. NOTE: Needs to 
+            be called before calling next().
         """
-        self.__rng = RandomGenerator.new_generator()
+        self.__rng = RandomGenerator.new_generator(stream)
         return self
 
     def next(self):
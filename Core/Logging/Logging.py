@@ -1,5 +1,10 @@
 import logging
+import logging.handlers
+import threading
+import atexit
+import queue
 import sys
+import os
 from enum import IntEnum
 
 """
@@ -10,7 +15,14 @@ from enum import IntEnum
     simulation time.
 
     Basic usage (through static log method):
-    SimLogger.log(<LogLevel>, <message>)
+    SimLogger.log(<LogLevel>, <message>, *<args>)
+
+    Message is formatted with <args> (str.format) only if <LogLevel> is enabled,
+    so disabled messages cost a single comparison. Log records can be written
+    either synchronously or by background writer thread (LogWriter.ASYNCHRONOUS).
+
+    SimLogger normally writes through the process-wide Logger singleton. Standalone
+    SimLogger (used by simulation contexts) writes into its own handlers instead.
 
 """
 
@@ -26,6 +38,72 @@ class LogLevel(IntEnum):
     CRITICAL = 50
 
 
+class LogWriter(IntEnum):
+    """
+        Supported log writers.
+    """
+    SYNCHRONOUS  = 0
+    ASYNCHRONOUS = 1
+
+
+class AsyncLogWriter:
+    """
+        Background thread writing queued log records into stream handlers in batches.
+        Handlers are flushed once per batch instead of once per record.
+    """
+    BATCH_SIZE = 1024
+
+    def __init__(self, handlers):
+        self.queue = queue.SimpleQueue()
+        self.handlers = handlers
+        self.__thread = threading.Thread(target=self.__write, name="AsyncLogWriter", daemon=True)
+        self.__thread.start()
+        atexit.register(self.stop)
+        os.register_at_fork(after_in_child=self.__after_fork)
+
+
+    def stop(self):
+        """
+            Writes all pending records and stops writer thread.
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            self.queue.put(None)
+            self.__thread.join()
+
+
+    def __write(self):
+        """
+            Writer thread: waits for records and writes all pending records (at most BATCH_SIZE) at once.
+        """
+        while True:
+            records = [self.queue.get()]
+            while len(records) < AsyncLogWriter.BATCH_SIZE and not self.queue.empty():
+                records.append(self.queue.get())
+            stop = None in records
+            records = [r for r in records if r is not None]
+
+            for handler in self.handlers:
+                text = "".join(handler.format(r) + handler.terminator for r in records if r.levelno >= handler.level)
+                handler.acquire()
+                try:
+                    handler.stream.write(text)
+                    handler.flush()
+                except Exception:
+                    pass
+                finally:
+                    handler.release()
+            if stop:
+                return
+
+
+    def __after_fork(self):
+        """
+            Writer thread is not copied into forked (worker) process, so child process writes synchronously.
+        """
+        self.__thread = None
+        logging.root.handlers = self.handlers
+
+
 class Logger(object):
     """
         Wrapper singleton class for Python standard logging.
@@ -33,9 +111,10 @@ class Logger(object):
     
     __instance = None
     
-    def __new__(cls, level, stdout=True, file=None, format = ('%(asctime)s %(levelname)5.5s - %(message)s', "%Y-%m-%d %H:%M:%S")):
+    def __new__(cls, level, stdout=True, file=None, format = ('%(asctime)s %(levelname)5.5s - %(message)s', "%Y-%m-%d %H:%M:%S"), writer=LogWriter.SYNCHRONOUS):
         """
-            Creates singleton instance (first call only).
+            Creates singleton instance (first call only). With ASYNCHRONOUS <writer> records are
+            written by background thread.
         """
         if Logger.__instance is None:
             Logger.__instance = object.__new__(cls)
@@ -46,6 +125,12 @@ class Logger(object):
             stdout and handlers.append(logging.StreamHandler(sys.stdout))
             file is not None and handlers.append(logging.FileHandler(file))
             
+            if len(handlers) != 0 and writer == LogWriter.ASYNCHRONOUS:
+                [h.setFormatter(logging.Formatter(format[0], format[1])) for h in handlers]
+                Logger.__instance._writer = AsyncLogWriter(handlers)
+                handlers = [logging.handlers.QueueHandler(Logger.__instance._writer.queue)]
+                handlers[0].setFormatter(logging.Formatter('%(message)s'))
+
             if len(handlers) != 0:
                 logging.basicConfig(level=int(level), 
                                     force=True,
@@ -73,29 +158,87 @@ class Logger(object):
             pass
 
 
+    @staticmethod
+    def create_standalone(level, stdout=True, file=None, format = ('%(asctime)s %(levelname)5.5s - %(message)s', "%Y-%m-%d %H:%M:%S")):
+        """
+            Creates logger that is not registered into logging module (records are not passed to root logger).
+        """
+        logger = logging.Logger(__name__, int(level))
+        logger.propagate = False
+        handlers = []
+        stdout and handlers.append(logging.StreamHandler(sys.stdout))
+        file is not None and handlers.append(logging.FileHandler(file))
+        for handler in handlers or [logging.NullHandler()]:
+            handler.setFormatter(logging.Formatter(format[0], format[1]))
+            logger.addHandler(handler)
+        return logger
+
+
 class SimLogger:
     """
         Adapter singleton class for Logger class that appends messages with simulation time.
     """
 
     __instance = None
+    _level = LogLevel.CRITICAL + 1      # Nothing is logged before initialization.
+    calls = 0                           # Number of log calls at enabled log level.
 
-    def __new__(cls, level, env, stdout=True, file=None):
+    def __new__(cls, level, env, stdout=True, file=None, writer=LogWriter.SYNCHRONOUS, standalone=False):
         """
-            Creates singleton instance (first call only).
+            Creates singleton instance (first call only). <standalone> instance writes into its own
+            (synchronous) handlers instead of Logger singleton.
         """
         if SimLogger.__instance is None:
             SimLogger.__instance = object.__new__(cls)
-            SimLogger.__instance.__logger = Logger(level, stdout=stdout, file=file, format=('%(asctime)s %(levelname)5.5s - %(message)s', "%Y-%m-%d %H:%M:%S"))
+            if standalone:
+                SimLogger.__instance.__logger = Logger.create_standalone(level, stdout=stdout, file=file)
+            else:
+                SimLogger.__instance.__logger = Logger(level, stdout=stdout, file=file, format=('%(asctime)s %(levelname)5.5s - %(message)s', "%Y-%m-%d %H:%M:%S"), writer=writer)
             SimLogger.__instance.__env = env
+            SimLogger.__instance.__level = int(level)
+            SimLogger._level = int(level)
         return SimLogger.__instance
+
+
+    @staticmethod
+    def _swap(instance):
+        """
+            Replaces singleton instance with <instance> (None to create a new one on the next call). Returns replaced instance.
+        """
+        previous = SimLogger.__instance
+        SimLogger.__instance = instance
+        SimLogger._level = instance.__level if instance is not None else LogLevel.CRITICAL + 1
+        return previous
+
+
+    @staticmethod
+    def is_enabled(level):
+        """
+            Returns True if messages with log level <level> are logged.
+        """
+        return level >= SimLogger._level
+
+
+    @staticmethod
+    def set_environment(env):
+        """
+            Sets simulation environment <env> used to prefix messages with simulation time.
+        """
+        try:
+            SimLogger.__instance.__env = env
+        except:
+            pass
         
     @staticmethod
-    def log(level, message):
+    def log(level, message, *args):
         """
             Writes single <message> (prefixed by simulation time) with log level <level> into log.
+            Message is formatted with <args> only if <level> is enabled.
         """
+        if level < SimLogger._level:
+            return
+        SimLogger.calls += 1
         try:
-            SimLogger.__instance.__logger.log(level, '({:.0f}) {}'.format(SimLogger.__instance.__env.now, message))
+            SimLogger.__instance.__logger.log(level, '({:.0f}) {}'.format(SimLogger.__instance.__env.now, message.format(*args) if args else message))
         except:
             pass
@@ -139,8 +139,12 @@ class SimulationParameters():
             Parses parameters from <lines>, where each line is format <PARAMATER_NAME>: <PARAMETER_VALUE>.
         """
 
-        # Fill with defaults:
+        # Fill with defaults (defaults given as strings or lists are parsed like provided values, e.g. enums and distributions):
         self._parameters = {k: v.get_default_value() for k, v in supported_parameters.items()}
+        for k, v in supported_parameters.items():
+            if isinstance(self._parameters[k], (str, list)):
+                parsed, _ = v.validate(self._parameters[k] if isinstance(self._parameters[k], str) else repr(self._parameters[k]))
+                self._parameters[k] = self._parameters[k] if parsed is None else parsed
 
         # Override default values with provided values:
         for i in range(len(lines)):
@@ -168,6 +172,13 @@ class SimulationParameters():
             self._parameters[name] = parsed
         
 
+    def __iter__(self):
+        """
+            Iterates names of all parameters (wildcard parameters by their full names).
+        """
+        return iter(self._parameters)
+
+
     def __getitem__(self, p):
         """
             Returns value of the parameter named <p>.
@@ -0,0 +1,86 @@
+from enum import IntEnum
+import tracemalloc
+import cProfile
+import pstats
+import io
+
+"""
+    Profiling Module
+
+    Profiler wraps single simulation run with cProfile (CPU) and/or tracemalloc (memory)
+    and writes report of the run into result folder:
+
+    - profile_<scenario>_<run>.prof: cProfile statistics (can be loaded with pstats or e.g. snakeviz)
+    - profile_<scenario>_<run>.txt:  counters of the run, functions with the largest cumulative time
+                                     and source lines with the largest allocated memory
+
+    Scenario is index of the scenario in a sweep or optimization (job index in job server).
+
+    Counters (events, processes, statistics updates, log calls, wall time per sample) are
+    collected always, they are cheap compared to the profilers.
+
+"""
+
+class ProfileMode(IntEnum):
+    """
+        Supported profiling modes.
+    """
+    NONE   = 0
+    CPU    = 1
+    MEMORY = 2
+    FULL   = 3
+
+
+class Profiler:
+    """
+        Context manager that profiles the code executed inside it according to <mode>.
+    """
+    FUNCTIONS = 40
+    LINES = 25
+
+    def __init__(self, mode):
+        self.__mode = mode
+        self.__profile = None
+        self.__snapshot = None
+
+
+    def __enter__(self):
+        if self.__mode & ProfileMode.MEMORY:
+            tracemalloc.start()
+        if self.__mode & ProfileMode.CPU:
+            self.__profile = cProfile.Profile()
+            self.__profile.enable()
+        return self
+
+
+    def __exit__(self, *args):
+        if self.__profile is not None:
+            self.__profile.disable()
+        if self.__mode & ProfileMode.MEMORY:
+            self.__snapshot = tracemalloc.take_snapshot()
+            self.__peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+    def write(self, path, counters):
+        """
+            Writes reports into files <path>.prof and <path>.txt. <counters> (dictionary) are written
+            at the beginning of text report.
+        """
+        if self.__mode is ProfileMode.NONE:
+            return
+        report = ["Counters:"] + ["    {:30} {}".format(name, value) for name, value in counters.items()]
+
+        if self.__profile is not None:
+            self.__profile.dump_stats(str(path) + ".prof")
+            stream = io.StringIO()
+            pstats.Stats(self.__profile, stream=stream).sort_stats("cumulative").print_stats(Profiler.FUNCTIONS)
+            report += ["", "CPU profile (cumulative time):", stream.getvalue()]
+
+        if self.__snapshot is not None:
+            statistics = self.__snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics("lineno")
+            report += ["", "Memory profile (peak {:.1f} MB, largest allocations by line):".format(self.__peak / 1024.0 ** 2)]
+            report += ["    {}".format(stat) for stat in statistics[:Profiler.LINES]]
+
+        with open(str(path) + ".txt", "w") as file:
+            file.write("\n".join(report) + "\n")
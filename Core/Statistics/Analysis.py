@@ -0,0 +1,265 @@
+from Core.Statistics.Statistics import TimeWeighted
+from enum import Enum
+from array import array
+import math
+
+"""
+    Analysis Module
+
+    Output analysis of simulated series.
+
+    Warm-up detection (MSER-5): observed series is averaged into batches of five observations
+    and truncation point d is chosen to minimize marginal standard error
+
+        MSER(d) = sum((Y_i - mean(Y_d+1..n))^2 for i > d) / (n - d)^2
+
+    Truncation point is accepted only from the first half of the series, otherwise the
+    series is considered to be still in transient state. Last five batches are never used as
+    truncation point, because MSER of the few remaining batches is unstable.
+
+    Batch means: samples of contiguous base batches (value and count of each) are merged
+    into batches of doubling size until lag-1 autocorrelation of batch means of every
+    statistic is at most given limit or not significant (below 1.96 / sqrt(<number of batches>)),
+    while keeping at least MIN_BATCHES batches.
+
+    Sample spacing: autocorrelation function of base batch means (estimated from single
+    long pilot run) gives correlation of means of two samples of m base batches separated
+    by g base batches:
+
+        corr(m, g) = sum((m - |d|) * r(m + g + d) for |d| < m) / sum((m - |d|) * r(|d|) for |d| < m)
+
+    Autocorrelations are cut off (set to zero) after the first lag, where they are not
+    significant (below 1.96 / sqrt(<number of base batches>)). Base batches of the pilot run
+    are first merged until every batch of each observed statistic has observations, so that
+    sparse statistics are not left out and recommended samples are never shorter than that.
+
+"""
+
+MIN_BATCHES = 10
+
+class SamplingMode(Enum):
+    """
+        Supported sampling modes: samples separated by intervals or contiguous batches.
+    """
+    INTERVALS   = 0,
+    BATCH_MEANS = 1
+
+
+class SampleAnalysis(Enum):
+    """
+        Supported modes of pilot run analysis of sample length and spacing.
+    """
+    NONE      = 0,
+    RECOMMEND = 1,
+    APPLY     = 2
+
+
+class WarmUpDetection(Enum):
+    """
+        Supported warm-up detection methods.
+    """
+    FIXED = 0,
+    MSER5 = 1
+
+
+def batch_means(values, size):
+    """
+        Returns means of consecutive non-overlapping batches of <size> values (incomplete batch is dropped).
+    """
+    return [sum(values[i:i + size]) / size for i in range(0, len(values) - size + 1, size)]
+
+
+def lag_correlation(values, lag=1):
+    """
+        Returns lag <lag> autocorrelation of <values> (None if there are not enough values).
+    """
+    n = len(values)
+    if n <= lag + 1:
+        return None
+    mean = sum(values) / n
+    variance = sum((v - mean) ** 2 for v in values)
+    if variance == 0:
+        return 0.0
+    return sum((values[i] - mean) * (values[i + lag] - mean) for i in range(n - lag)) / variance
+
+
+def merge_batches(values, counts, size, counter=False):
+    """
+        Merges <values> and <counts> of consecutive samples into batches of <size> samples (incomplete batch is dropped).
+        Samples of <counter> statistics (Counter) keep count 1, so that value of merged batch is the total of the batch.
+    """
+    n = len(values) // size
+    return array('d', [sum(values[i * size:(i + 1) * size]) for i in range(n)]), array('d', [1.0] * n if counter else [sum(counts[i * size:(i + 1) * size]) for i in range(n)])
+
+
+def autocorrelations(values, max_lag):
+    """
+        Returns autocorrelations of <values> at lags 0..<max_lag>. Autocorrelations after the first
+        non-significant lag are set to zero.
+    """
+    n = len(values)
+    mean = sum(values) / n
+    deviations = [v - mean for v in values]
+    variance = sum(d * d for d in deviations)
+    if variance == 0:
+        return [1.0] + [0.0] * max_lag
+
+    limit, cut = 1.96 / math.sqrt(n), False
+    correlations = [1.0]
+    for lag in range(1, max_lag + 1):
+        r = sum(deviations[i] * deviations[i + lag] for i in range(n - lag)) / variance if lag < n else 0.0
+        cut = cut or abs(r) < limit
+        correlations.append(0.0 if cut else r)
+    return correlations
+
+
+def sample_correlation(correlations, length, gap):
+    """
+        Returns correlation of means of two samples of <length> base batches separated by <gap> base batches,
+        where <correlations> are autocorrelations of base batch means (zero beyond the last lag).
+    """
+    r = lambda lag: correlations[lag] if lag < len(correlations) else 0.0
+    weights = [(length - abs(d), d) for d in range(-length + 1, length)]
+    return sum(w * r(length + gap + d) for w, d in weights) / sum(w * r(abs(d)) for w, d in weights)
+
+
+def get_observed_size(samples, min_batches=MIN_BATCHES):
+    """
+        Returns the smallest number of base batches per batch, at which every batch of each statistic in <samples>
+        (values and counts of base batches by statistic name) has observations, or None if there would be less than
+        <min_batches> batches. Statistics without any observations are not considered.
+    """
+    n = min(len(values) for values, _ in samples.values())
+    observed = [(values, counts) for values, counts in samples.values() if any(c != 0 for c in counts)]
+    for size in range(1, n // min_batches + 1):
+        if all(all(c != 0 for c in merge_batches(values, counts, size)[1]) for values, counts in observed):
+            return size
+    return None
+
+
+def get_sample_correlations(samples, max_lag):
+    """
+        Returns autocorrelations of base batch means of each statistic in <samples> (values and counts of base
+        batches by statistic name). Statistics with empty base batches are not considered.
+    """
+    return {name: autocorrelations([v / c for v, c in zip(values, counts)], max_lag)
+            for name, (values, counts) in samples.items() if len(values) > 1 and all(c != 0 for c in counts)}
+
+
+def get_sample_spacing(correlations, length, max_correlation, max_gap):
+    """
+        Returns the smallest gap (in base batches, at most <max_gap>) between samples of <length> base batches,
+        at which correlation of consecutive samples is at most <max_correlation> for all statistics (None if not found).
+    """
+    for gap in range(max_gap + 1):
+        if all(sample_correlation(r, length, gap) <= max_correlation for r in correlations.values()):
+            return gap
+    return None
+
+
+def get_sample_length(correlations, gap, max_correlation, max_length):
+    """
+        Returns the smallest length (in base batches, at most <max_length>) of samples separated by <gap> base batches,
+        at which correlation of consecutive samples is at most <max_correlation> for all statistics (None if not found).
+    """
+    for length in range(1, max_length + 1):
+        if all(sample_correlation(r, length, gap) <= max_correlation for r in correlations.values()):
+            return length
+    return None
+
+
+def get_batch_size(samples, max_correlation, min_batches=MIN_BATCHES):
+    """
+        Returns number of base batches per batch and the largest lag-1 autocorrelation of batch means
+        for <samples> (values and counts of base batches by statistic name). Statistics with empty
+        batches are not considered.
+    """
+    n = min(len(values) for values, _ in samples.values())
+    size = 1
+    while True:
+        correlation = 0.0
+        for values, counts in samples.values():
+            values, counts = merge_batches(values, counts, size)
+            if all(c != 0 for c in counts):
+                correlation = max(correlation, lag_correlation([v / c for v, c in zip(values, counts)]) or 0.0)
+        if correlation <= max(max_correlation, 1.96 / math.sqrt(max(1, n // size))) or n // (size * 2) < min_batches:
+            return size, correlation
+        size *= 2
+
+
+def mser(values):
+    """
+        Returns truncation index d (number of values to discard) minimizing MSER(d) over the first half of <values>,
+        or None if the minimum lies in the second half (series is not yet stationary).
+    """
+    n = len(values)
+    if n < 2:
+        return None
+
+    # Suffix sums of values and squared values:
+    sums, squares = [0.0] * (n + 1), [0.0] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        sums[i] = sums[i + 1] + values[i]
+        squares[i] = squares[i + 1] + values[i] * values[i]
+
+    # Last values are not considered as truncation points (too few values left for a stable estimate):
+    best, truncation = float('inf'), None
+    for d in range(max(1, n - 5)):
+        m = n - d
+        value = (squares[d] - sums[d] * sums[d] / m) / (m * m)
+        if value < best:
+            best, truncation = value, d
+    return truncation if truncation <= n // 2 else None
+
+
+class WarmUpDetector:
+    """
+        Observes time-weighted levels of series <names> in windows of <observation> hours and detects
+        end of the transient with MSER-5.
+    """
+    BATCH_SIZE = 5
+
+    def __init__(self, names, observation, start=0.0, min_batches=10):
+        self.observation = observation
+        self.__min_batches = min_batches
+        self.__levels = {}
+        self.__windows = {name: TimeWeighted() for name in names}
+        self.__series = {name: [] for name in names}
+        [self.update(name, 0.0, start) for name in names]
+
+
+    def update(self, name, level, time):
+        """
+            Updates level of series <name> at <time>.
+        """
+        self.__levels[name] = level
+        self.__windows[name].update(level, time)
+
+
+    def observe(self, time):
+        """
+            Closes observation window at <time>: appends time-average of each series and starts a new window.
+        """
+        for name, window in self.__windows.items():
+            level = self.__levels[name]
+            window.update(level, time)
+            self.__series[name].append(window.get_value() / window.get_count() if window.get_count() > 0 else level)
+            self.__windows[name] = TimeWeighted()
+            self.__windows[name].update(level, time)
+
+
+    def get_truncation(self):
+        """
+            Returns detected truncation point in hours (the latest over all series), or None if any
+            of the series is still in transient state or not enough observations are collected.
+        """
+        truncation = 0
+        for series in self.__series.values():
+            batches = batch_means(series, WarmUpDetector.BATCH_SIZE)
+            if len(batches) < self.__min_batches:
+                return None
+            d = mser(batches)
+            if d is None:
+                return None
+            truncation = max(truncation, d * WarmUpDetector.BATCH_SIZE * self.observation)
+        return truncation
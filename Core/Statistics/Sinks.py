@@ -0,0 +1,212 @@
+from Core.Exceptions import SimulationException
+from abc import ABCMeta, abstractmethod
+from enum import IntEnum
+from array import array
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+"""
+    Sinks Module
+
+    Results sinks receive samples of each simulation run as soon as the run is completed,
+    so that results of completed runs are not lost if the simulation is interrupted.
+    Samples are stored in long format, one row per (scenario, run, sample, statistic):
+
+        scenario | run | sample | statistic | value | count
+
+    Supported formats:
+    - CSV:     rows are appended into single samples.csv file (flushed after each run)
+    - NPZ:     each run is written into its own part file samples/part-<scenario>-<run>.npz
+               with typed columns (requires NumPy)
+    - PARQUET: as NPZ, but part files are Parquet files (requires PyArrow)
+
+    Part files are written atomically (temporary file renamed into place), so a part file
+    either contains all samples of a run or does not exist. Runs are recorded into job manifest
+    before they are written into the sink, and the sink is always recreated: when interrupted
+    simulation is resumed, runs restored from the manifest are written into the sink again, so
+    an interrupted row or samples of a run missing from the manifest are not kept. New sinks
+    can be added by subclassing ResultsSink and registering the class into ResultsSink.FORMATS.
+
+"""
+
+class SinkFormat(IntEnum):
+    """
+        Supported results sink formats.
+    """
+    NONE    = 0
+    CSV     = 1
+    NPZ     = 2
+    PARQUET = 3
+
+
+class ResultsSink:
+    """
+        Base class for results sinks (discards samples).
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+
+    @staticmethod
+    def create(format, folder):
+        """
+            Creates sink of <format> writing into <folder>.
+        """
+        return ResultsSink.FORMATS[format](folder)
+
+
+    @staticmethod
+    def get_columns(scenario, run, samples):
+        """
+            Returns columns of long format rows of <samples> (dictionary of sample values and
+            counts by statistic name) and list of statistic names indexed by statistic column.
+        """
+        names = list(samples.keys())
+        columns = {"scenario": array('i'), "run": array('i'), "sample": array('i'), "statistic": array('i'), "value": array('d'), "count": array('d')}
+        for i, name in enumerate(names):
+            values, counts = samples[name]
+            columns["scenario"].extend([scenario] * len(values))
+            columns["run"].extend([run] * len(values))
+            columns["sample"].extend(range(len(values)))
+            columns["statistic"].extend([i] * len(values))
+            columns["value"].extend(values)
+            columns["count"].extend(counts)
+        return columns, names
+
+
+    def write(self, scenario, run, samples):
+        """
+            Writes <samples> of single <run> of <scenario>.
+        """
+        pass
+
+
+    def close(self):
+        pass
+
+
+
+class CsvSink(ResultsSink):
+    """
+        Appends samples into single samples.csv file.
+    """
+
+    def __init__(self, folder, decimal_delimeter=","):
+        super().__init__(folder)
+        self.__decimal_delimeter = decimal_delimeter
+        self.__file = open(folder / "samples.csv", "w")
+        self.__file.write("SEP=;\nscenario;run;sample;statistic;value;count\n")
+        self.__file.flush()
+
+
+    def write(self, scenario, run, samples):
+        columns, names = ResultsSink.get_columns(scenario, run, samples)
+        rows = zip(columns["scenario"], columns["run"], columns["sample"], (names[i] for i in columns["statistic"]), columns["value"], columns["count"])
+        self.__file.write("".join("{};{};{};{};{};{}\n".format(*row[:4], str(row[4]).replace(".", self.__decimal_delimeter), str(row[5]).replace(".", self.__decimal_delimeter)) for row in rows))
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+
+    def close(self):
+        self.__file.close()
+
+
+
+class PartSink(ResultsSink, metaclass=ABCMeta):
+    """
+        Base class for sinks writing each run into its own part file.
+    """
+    EXTENSION = ""
+
+    def __init__(self, folder):
+        super().__init__(folder)
+        (folder / "samples").mkdir(parents=True, exist_ok=True)
+
+
+    def write(self, scenario, run, samples):
+        path = self.folder / "samples" / "part-{}-{}{}".format(scenario, run, self.EXTENSION)
+        temporary = path.with_name(path.name + ".tmp")
+        with open(temporary, "wb") as file:
+            self._write_part(file, *ResultsSink.get_columns(scenario, run, samples))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+
+    @abstractmethod
+    def _write_part(self, file, columns, names):
+        """
+            Writes <columns> of single run (statistic column holds indices into <names>) into part <file>.
+        """
+        pass
+
+
+
+class NpzSink(PartSink):
+    """
+        Writes each run into NumPy npz part file (arrays of columns + statistic_names).
+    """
+    EXTENSION = ".npz"
+
+    def __init__(self, folder):
+        if numpy is None:
+            raise SimulationException("NumPy is required for results sink NPZ.")
+        super().__init__(folder)
+
+
+    def _write_part(self, file, columns, names):
+        numpy.savez(file, statistic_names=numpy.array(names), **{k: numpy.frombuffer(v, dtype=v.typecode) for k, v in columns.items()})
+
+
+    @staticmethod
+    def load(folder):
+        """
+            Loads all part files written into <folder>. Returns dictionary of concatenated columns,
+            statistic column holds statistic names.
+        """
+        parts = []
+        for path in sorted((folder / "samples").glob("part-*.npz")):
+            with numpy.load(path) as part:
+                columns = {k: part[k] for k in part.files if k != "statistic_names"}
+                columns["statistic"] = part["statistic_names"][columns["statistic"]]
+                parts.append(columns)
+        return {k: numpy.concatenate([p[k] for p in parts]) for k in parts[0]} if parts else {}
+
+
+
+class ParquetSink(PartSink):
+    """
+        Writes each run into Parquet part file (statistic names are stored as dictionary encoded column).
+    """
+    EXTENSION = ".parquet"
+
+    def __init__(self, folder):
+        if pyarrow is None:
+            raise SimulationException("PyArrow is required for results sink PARQUET.")
+        super().__init__(folder)
+
+
+    def _write_part(self, file, columns, names):
+        arrays = {k: pyarrow.array(v) for k, v in columns.items()}
+        arrays["statistic"] = pyarrow.DictionaryArray.from_arrays(arrays["statistic"], pyarrow.array(names))
+        pyarrow.parquet.write_table(pyarrow.table(arrays), file)
+
+
+
+ResultsSink.FORMATS = {
+    SinkFormat.NONE:    ResultsSink,
+    SinkFormat.CSV:     CsvSink,
+    SinkFormat.NPZ:     NpzSink,
+    SinkFormat.PARQUET: ParquetSink,
+}
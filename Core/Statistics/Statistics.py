@@ -2,7 +2,9 @@ from Core.Exceptions import SimulationException
 from Core.Logging.Logging import SimLogger as Logger, LogLevel
 from abc import ABCMeta, abstractmethod
 from enum import IntEnum, Enum
+from array import array
 import math
+import ast
 
 """
 
@@ -10,6 +12,9 @@ import math
 
     Statistics can managed through Statistics singleton class.
 
+    PrecisionTargets holds user provided targets for confidence interval half-widths,
+    used to decide whether more samples are needed.
+
 """
 
 class ConfidenceInterval(IntEnum):
@@ -20,6 +25,11 @@ class ConfidenceInterval(IntEnum):
     CONFIDENCE_99 = 2576
 
 
+class Precision(Enum):
+    ABSOLUTE = 0,
+    RELATIVE = 1
+
+
 class Counter:
     """
         Stores single scalar.
@@ -56,9 +66,38 @@ class CounterMean:
         return self.__count
 
 
+class TimeWeighted:
+    """
+        Stores time integral of a piecewise constant value + time elapsed since first update.
+        Value is updated only when it changes: update(<new value>, <time of change>).
+    """
+    def __init__(self):
+        self.__value = 0
+        self.__level = 0
+        self.__start = None
+        self.__time = None
+
+    def update(self, level, time):
+        if self.__time is None:
+            self.__start = time
+        else:
+            self.__value += self.__level * (time - self.__time)
+        self.__level = level
+        self.__time = time
+
+    def get_value(self):
+        return self.__value
+
+    def get_count(self):
+        return 0 if self.__time is None else self.__time - self.__start
+
+
 class SampleCollection():
     """
-        Simple collection class to hold sample of a single statistic.
+        Simple collection class to hold sample of a single statistic. Only the last (current)
+        sample is kept as an object of <type>, completed samples are stored as plain values and
+        counts in arrays. Summaries are kept in online (Welford) accumulators, so that updates 
+        and queries take constant time regardless of number of samples.
     """
     
     def __init__(self, desc_l="", desc_s="", unit = "", type=CounterMean):
@@ -67,54 +106,128 @@ class SampleCollection():
             when collection is output as an table, <description_long> is
             title when collection is output as an single line.
         """
-        self.__samples   = []
+        self.__values    = array('d')
+        self.__counts    = array('d')
+        self.__current   = None
         self.__type      = type
         self.title_short = desc_s
         self.title_long  = desc_l
         self.unit        = unit
 
+        # Accumulators of completed samples (sums and Welford's mean and M2 of sample means):
+        self.__sum       = 0.0
+        self.__count     = 0.0
+        self.__mean      = 0.0
+        self.__m2        = 0.0
+
 
     def add(self):
         """
-            Adds new sample to collection.
+            Adds new sample to collection. Updates of the collection are bound directly to the new sample.
         """
-        self.__samples.append(self.__type())
+        self.__complete_current()
+        self.__current = self.__type()
+        self.update = self.__current.update
         return self
 
     def update(self, *args):
         """
             Updates last samples with data <*args>.
         """
-        self.__samples[-1].update(*args)
-        pass
+        self.__current.update(*args)
+
+
+    def get_type(self):
+        """
+            Returns type of samples in collection.
+        """
+        return self.__type
+
+
+    def get_samples(self):
+        """
+            Returns all samples in collection as arrays of values and counts.
+        """
+        self.__complete_current()
+        return self.__values, self.__counts
+
+
+    def extend(self, samples):
+        """
+            Appends <samples> (values and counts, e.g. samples collected in another process) to collection.
+        """
+        self.__complete_current()
+        [self.__append(value, count) for value, count in zip(*samples)]
+
+
+    def __complete_current(self):
+        """
+            Moves current sample (if any) into completed samples.
+        """
+        if self.__current is not None:
+            self.__append(self.__current.get_value(), self.__current.get_count())
+            self.__current = None
+            del self.update
+
+
+    def __append(self, value, count):
+        """
+            Appends completed sample and updates accumulators.
+        """
+        self.__values.append(value)
+        self.__counts.append(count)
+        self.__sum += value
+        self.__count += count
+        self.__mean, self.__m2 = SampleCollection.__welford(len(self.__values), self.__mean, self.__m2, float('nan') if count == 0 else value / count)
+
+
+    @staticmethod
+    def __welford(n, mean, m2, x):
+        """
+            Returns mean and M2 updated with <x> as <n>th value.
+        """
+        delta = x - mean
+        mean += delta / n
+        return mean, m2 + delta * (x - mean)
+
+
+    def __len__(self):
+        return len(self.__values) + (self.__current is not None)
     
 
     def get_value(self, sample):
-        return float('nan') if self.__samples[sample].get_count() == 0 else self.__samples[sample].get_value() / self.__samples[sample].get_count()
+        if self.__current is not None and (sample == -1 or sample == len(self.__values)):
+            value, count = self.__current.get_value(), self.__current.get_count()
+        else:
+            value, count = self.__values[sample], self.__counts[sample]
+        return float('nan') if count == 0 else value / count
 
     def get_values(self):
-        return [float('nan') if s.get_count() == 0 else s.get_value() / s.get_count() for s in self.__samples]
+        return [float('nan') if c == 0 else v / c for v, c in zip(self.__values, self.__counts)] + ([self.get_value(-1)] if self.__current is not None else [])
 
     def get_sum(self):
         """
             Calculates sum of samples.
         """
-        return sum([s.get_value() for s in self.__samples])
+        return self.__sum + (self.__current.get_value() if self.__current is not None else 0)
 
 
     def get_mean(self):
         """
             Calculates mean (average) of samples.
         """
-        return self.get_sum() / sum([s.get_count() for s in self.__samples])
+        return self.get_sum() / (self.__count + (self.__current.get_count() if self.__current is not None else 0))
 
 
     def get_variance(self):
         """
-            Calculates variance for samples.
+            Calculates variance of sample means around the mean of samples.
         """
-        mean = self.get_mean();
-        return sum([((s.get_value() / s.get_count()) - mean)**2 for s in self.__samples]) / (len(self.__samples) - 1)
+        n, mean, m2 = len(self.__values), self.__mean, self.__m2
+        if self.__current is not None:
+            n += 1
+            mean, m2 = SampleCollection.__welford(n, mean, m2, self.get_value(-1))
+        return (m2 + n * (mean - self.get_mean())**2) / (n - 1)
 
 
     def get_standard_deviation(self):
@@ -128,14 +241,76 @@ class SampleCollection():
         """
             Calculates confidence interval for given confidence level <level>.
         """
-        return level / 1000.0 * self.get_standard_deviation() / math.sqrt(len(self.__samples))
+        return level / 1000.0 * self.get_standard_deviation() / math.sqrt(len(self))
     
 
+class PrecisionTargets:
+    """
+        Class for parsing and storing user provided targets for confidence interval half-widths.
+        Format: {<statistic name>: [<"ABSOLUTE" or "RELATIVE">, <half-width>]}, where relative 
+        half-width is a fraction of the mean (0.01 => 1%).
+    """
+
+    def __init__(self, string):
+        self.targets = {name: (Precision[target[0]], float(target[1])) for name, target in ast.literal_eval(string).items()}
+
+
+    def __repr__(self):
+        return repr({name: [precision.name, width] for name, (precision, width) in self.targets.items()})
+
+
+    def __len__(self):
+        return len(self.targets)
+
+
+    def validate(self, names):
+        """
+            Checks that targeted statistics exist in <names>.
+        """
+        for name in self.targets.keys():
+            if name not in names:
+                raise SimulationException("Statistics '{}' doesn't exist.".format(name))
+
+
+    def get_precision_ratio(self, statistics, level=ConfidenceInterval.CONFIDENCE_95):
+        """
+            Returns the largest squared ratio of confidence interval half-width to target half-width
+            over targeted <statistics> (dictionary of sample collections). Targets are met when ratio is 
+            at most one, otherwise ratio estimates how many times more samples are needed.
+        """
+        ratio = 0.0
+        for name, (precision, width) in self.targets.items():
+            try:
+                half_width = statistics[name].get_confidence_interval(level)
+                target = width * abs(statistics[name].get_mean()) if precision is Precision.RELATIVE else width
+            except ZeroDivisionError:
+                return float('inf')
+            # Undefined half-width (e.g. samples without observations) never meets the target:
+            if math.isnan(half_width) or math.isnan(target):
+                return float('inf')
+            if half_width > 0:
+                ratio = max(ratio, (half_width / target) ** 2 if target > 0 else float('inf'))
+        return ratio
+
+
+    def get_run_count(self, statistics, runs, max_runs, level=ConfidenceInterval.CONFIDENCE_95):
+        """
+            Returns total number of runs needed to meet targets of <statistics> merged from <runs> runs, at
+            most <max_runs> (<runs> if targets are met or <max_runs> is reached).
+        """
+        ratio = self.get_precision_ratio(statistics, level)
+        if ratio <= 1.0 or runs >= max_runs:
+            return runs
+        needed = math.ceil(runs * ratio) if math.isfinite(ratio) else runs + 1
+        return min(max(needed, runs + 1), max_runs)
+
+
 class Statistics:
     """
         Singleton for storing statistics.
     """
     __instance = None
+    updates = 0         # Number of update_sample calls since the last clear.
     
     def __new__(cls):
         """
@@ -148,6 +323,16 @@ class Statistics:
         return Statistics.__instance
 
 
+    @staticmethod
+    def _swap(instance):
+        """
+            Replaces singleton instance with <instance> (None to create a new one on the next call). Returns replaced instance.
+        """
+        previous = Statistics.__instance
+        Statistics.__instance = instance
+        return previous
+
+
     @staticmethod
     def add_statistic(name, statistic):
         """
@@ -158,6 +343,16 @@ class Statistics:
         Statistics.__instance.__statistics[name] = statistic
 
 
+    @staticmethod
+    def clear():
+        """
+            Removes all statistic collections.
+        """
+        Statistics.__instance.__statistics = dict()
+        Statistics.__instance.__block = True
+        Statistics.updates = 0
+
+
     @staticmethod
     def start_sample():
         """
@@ -180,11 +375,14 @@ class Statistics:
         """
             Adds data to previously created statistic.
         """
-        if not Statistics.__instance.__block:
-            if name not in Statistics.__instance.__statistics:
-                Logger.log(LogLevel.WARNING, "Trying to update statistic '{}', but no statistic with given name exist.".format(name))
+        Statistics.updates += 1
+        instance = Statistics.__instance
+        if not instance.__block:
+            statistic = instance.__statistics.get(name)
+            if statistic is None:
+                Logger.log(LogLevel.WARNING, "Trying to update statistic '{}', but no statistic with given name exist.", name)
             else:
-                Statistics.__instance.__statistics[name].update(*args)
+                statistic.update(*args)
 
         
     @staticmethod
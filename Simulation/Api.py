@@ -0,0 +1,92 @@
+from Simulation.Simulation import Simulation
+from Simulation.Replication import Replication
+from Simulation.Context import SimulationContext
+from Core.Exceptions import SimulationException
+
+"""
+    Api module
+
+    In-process interface for embedding the simulator (e.g. into optimization loop). Parameters
+    are given as dictionary with the same names and values as in configuration file, and
+    results are returned as objects instead of files:
+
+        from Simulation.Api import simulate
+
+        result = simulate({"number-of-recovery-units": 5, "patient-interval": ["EXPONENTIAL", 22.5], "number-of-runs": 5})
+        print(result["arrival-queue-length"].get_mean())
+
+    Runs are executed one after another in the calling process (no worker processes, command
+    line arguments or configuration files). State of the simulation is kept in its own
+    SimulationContext, so that simulations don't affect each other. Nothing is logged or
+    printed by default (log-out: LOG_NONE), and no files are written unless requested by
+    parameters (event-trace, patient-records, profile).
+
+"""
+
+class SimulationResult:
+    """
+        Results of single simulated scenario.
+    """
+
+    def __init__(self, parameters, statistics, samples, counters):
+        self.parameters = parameters        # Parsed simulation parameters.
+        self.statistics = statistics        # Merged sample collections of all runs by statistic name.
+        self.samples = samples              # Samples (values and counts by statistic name) of each run.
+        self.counters = counters            # Counters of each run.
+
+
+    def __getitem__(self, name):
+        return self.statistics[name]
+
+
+    def get_means(self):
+        """
+            Returns means of all statistics by statistic name (NaN if statistic has no samples).
+        """
+        means = {}
+        for name, stat in self.statistics.items():
+            try:
+                means[name] = stat.get_mean()
+            except (ZeroDivisionError, ValueError):
+                means[name] = float('nan')
+        return means
+
+
+
+def get_configuration(parameters):
+    """
+        Returns configuration lines of <parameters> (dictionary of parameter names and values). Strings
+        (e.g. enums) are used as they are, other values are converted to their literal representation.
+    """
+    return ["log-out: LOG_NONE\n"] + ["{}: {}\n".format(name, value if isinstance(value, str) else repr(value)) for name, value in parameters.items()]
+
+
+def simulate(parameters, context=None):
+    """
+        Simulates single scenario with <parameters> (dictionary of parameter names and values, unspecified
+        parameters have their default values) in <context> (new context if not given). Number of runs is
+        given by number-of-runs, or by target-precision and max-number-of-runs. Returns SimulationResult.
+    """
+    lines = get_configuration(parameters)
+    context = context if context is not None else SimulationContext()
+    with context:
+        parameters = Simulation._parse_parameters(lines)
+        if len(parameters["sweep"]) != 0:
+            raise SimulationException("Parameter sweep is not supported in-process, simulate each scenario separately.")
+        patient_types = Simulation._get_patient_types(parameters)
+        parameters["target-precision"].validate(Replication.create_statistics(patient_types).keys())
+
+        samples, counters = [], []
+        runs = Replication.get_run_count(parameters, parameters["number-of-runs"])
+        while True:
+            for run in range(len(samples), runs):
+                replication = Replication(parameters, patient_types, run, verbose=False)
+                samples.append(replication.run())
+                counters.append(replication.counters)
+
+            statistics = Replication.merge_runs(parameters, patient_types, samples)
+
+            # Add runs until target precision is reached:
+            runs = min(Replication.get_run_count(parameters, parameters["target-precision"].get_run_count(statistics, len(samples), parameters["max-number-of-runs"])), parameters["max-number-of-runs"])
+            if runs == len(samples):
+                return SimulationResult(parameters, statistics, samples, counters)
@@ -0,0 +1,158 @@
+from enum import IntEnum
+from pathlib import Path
+import hashlib
+import json
+import os
+
+"""
+    Cache module
+
+    ResultCache stores samples of completed simulation runs on disk, so that runs that have
+    already been simulated (e.g. points revisited by sweeps that change one dimension at a
+    time) are not simulated again. Runs are fully deterministic given their parameters, so
+    each run is content-addressed by hash of:
+
+    - scenario key (normalized parameters affecting samples, including patient-condition-*)
+    - index of the run (random streams are derived from random-seed and the run)
+    - simulator version (hash of the simulator source code, so any code change invalidates
+      cached runs)
+
+    Each run is stored in its own json file <cache folder>/<key[:2]>/<key>.json with the same
+    format and round-trip float precision as job manifest entries, written atomically
+    (temporary file renamed into place). Total size of the cache is bounded: least recently
+    used runs (by modification time, which is updated on every hit) are evicted once the
+    size limit is exceeded.
+
+"""
+
+class CacheMode(IntEnum):
+    """
+        Supported result cache modes.
+    """
+    NONE       = 0
+    READ_WRITE = 1
+    REFRESH    = 2
+
+
+class ResultCache:
+    """
+        Size-bounded on-disk cache of samples of simulation runs (see module description).
+    """
+    # Packages whose source code defines the simulator version:
+    PACKAGES = ("Core", "Simulation")
+
+    def __init__(self, mode, folder, max_size):
+        """
+            Creates cache of <mode> in <folder> holding at most <max_size> bytes of samples.
+        """
+        self.mode = mode
+        self.hits = 0
+        self.__folder = Path(folder)
+        self.__max_size = max_size
+        self.__entries = {}
+        self.__size = 0
+        if mode is CacheMode.NONE:
+            return
+        self.__version = ResultCache.get_version()
+        self.__folder.mkdir(parents=True, exist_ok=True)
+        for path in self.__folder.glob("*/*.json"):
+            stat = path.stat()
+            self.__entries[path.stem] = [stat.st_mtime, stat.st_size]
+            self.__size += stat.st_size
+
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+    @staticmethod
+    def get_version():
+        """
+            Returns hash of the simulator source code.
+        """
+        root = Path(__file__).resolve().parent.parent
+        digest = hashlib.sha256()
+        for path in sorted(p for package in ResultCache.PACKAGES for p in (root / package).rglob("*.py")):
+            digest.update(path.relative_to(root).as_posix().encode())
+            digest.update(path.read_bytes())
+        return digest.hexdigest()[:16]
+
+
+    def get_key(self, scenario, run):
+        """
+            Returns key of <run> of <scenario> (scenario key).
+        """
+        return hashlib.sha256("{}\n{}\n{}".format(self.__version, scenario, run).encode()).hexdigest()
+
+
+    def get(self, scenario, run):
+        """
+            Returns cached samples of <run> of <scenario> (None if not cached or cache is not read).
+        """
+        if self.mode is not CacheMode.READ_WRITE:
+            return None
+        key = self.get_key(scenario, run)
+        if key not in self.__entries:
+            return None
+        path = self.__get_path(key)
+        try:
+            with open(path) as file:
+                samples = {name: tuple(samples) for name, samples in json.load(file).items()}
+            os.utime(path)
+        except (OSError, ValueError):
+            self.__remove(key)
+            return None
+        self.__entries[key][0] = path.stat().st_mtime
+        self.hits += 1
+        return samples
+
+
+    def add(self, scenario, run, samples):
+        """
+            Stores <samples> (values and counts by statistic name) of <run> of <scenario> and evicts least
+            recently used runs if the cache is full.
+        """
+        if self.mode is CacheMode.NONE:
+            return
+        key = self.get_key(scenario, run)
+        if key in self.__entries and self.mode is CacheMode.READ_WRITE:
+            return
+        path = self.__get_path(key)
+        path.parent.mkdir(exist_ok=True)
+        temporary = path.with_suffix(".tmp")
+        with open(temporary, "w") as file:
+            json.dump({name: [list(values), list(counts)] for name, (values, counts) in samples.items()}, file)
+        os.replace(temporary, path)
+
+        stat = path.stat()
+        self.__size += stat.st_size - (self.__entries[key][1] if key in self.__entries else 0)
+        self.__entries[key] = [stat.st_mtime, stat.st_size]
+        self.__evict(key)
+
+
+    def __evict(self, keep):
+        """
+            Removes least recently used runs (except <keep>) until the cache fits into its size limit.
+        """
+        if self.__size <= self.__max_size:
+            return
+        for key in sorted(self.__entries, key=lambda k: self.__entries[k][0]):
+            if self.__size <= self.__max_size:
+                break
+            if key != keep:
+                self.__remove(key)
+
+
+    def __remove(self, key):
+        """
+            Removes run <key> from the cache.
+        """
+        self.__size -= self.__entries.pop(key)[1]
+        try:
+            os.remove(self.__get_path(key))
+        except OSError:
+            pass
+
+
+    def __get_path(self, key):
+        return self.__folder / key[:2] / (key + ".json")
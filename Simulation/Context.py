@@ -0,0 +1,61 @@
+from Simulation.Patients import PatientRecords
+from Core.Logging.Logging import SimLogger as Logger, LogLevel
+from Core.Distributions import RandomGenerator as Random
+from Core.Statistics.Statistics import Statistics
+
+"""
+    Context module
+
+    Simulation modules use process-wide singletons (Statistics, SimLogger, RandomGenerator)
+    and class level counters (patient ids of PatientRecords, Statistics.updates and
+    SimLogger.calls). SimulationContext keeps its own instance of each of them and installs
+    them only while the context is active:
+
+        context = SimulationContext(LogLevel.WARNING)
+        with context:
+            ...     # all simulation state goes into this context
+
+    , so that multiple simulations can be executed (also interleaved) in the same process
+    without affecting each other or the command line simulation. Contexts can be nested,
+    state of the enclosing context is restored on exit. Contexts are not thread safe: only
+    one context can be active in a process at a time.
+
+"""
+
+class SimulationContext:
+    """
+        Per-simulation state normally kept in singletons.
+    """
+
+    def __init__(self, log_level=LogLevel.WARNING, stdout=False, file=None):
+        """
+            Creates context with its own statistics, random generator and logger. Messages with <log_level>
+            or higher are written into stdout (if <stdout> is set) and into <file> (if given), otherwise
+            nothing is logged.
+        """
+        self.statistics = None
+        self.random = None
+        self.logger = None
+        self.next_patient_id = 0
+        self.statistics_updates = 0
+        self.log_calls = 0
+        self.__previous = []
+        with self:
+            Statistics()
+            Logger(log_level if stdout or file is not None else LogLevel.CRITICAL + 1, None, stdout=stdout, file=file, standalone=True)
+
+
+    def __enter__(self):
+        self.__previous.append((Statistics._swap(self.statistics), Logger._swap(self.logger), Random._swap(self.random),
+                                PatientRecords._NEXT_ID, Statistics.updates, Logger.calls))
+        PatientRecords._NEXT_ID, Statistics.updates, Logger.calls = self.next_patient_id, self.statistics_updates, self.log_calls
+        return self
+
+
+    def __exit__(self, *args):
+        statistics, logger, random, next_patient_id, statistics_updates, log_calls = self.__previous.pop()
+        self.statistics = Statistics._swap(statistics)
+        self.logger = Logger._swap(logger)
+        self.random = Random._swap(random)
+        self.next_patient_id, self.statistics_updates, self.log_calls = PatientRecords._NEXT_ID, Statistics.updates, Logger.calls
+        PatientRecords._NEXT_ID, Statistics.updates, Logger.calls = next_patient_id, statistics_updates, log_calls
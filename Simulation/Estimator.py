@@ -0,0 +1,152 @@
+import ast
+
+"""
+    Estimator module
+
+    Analytic approximation of the surgery facility, computed from the same parameters as
+    the simulation in microseconds. Used to prune and rank scenarios of a parameter sweep
+    before they are simulated.
+
+    Facility is approximated as tandem of three stations (preparation, operation, recovery)
+    with blocking after service: patient keeps its unit until a unit of the next phase is
+    free. Service time of a station is base time weighted by service time multipliers and
+    portions of patient conditions. Blocking is added to effective service time of upstream
+    station, starting from recovery (which is never blocked):
+
+        S'(i) = S(i) + Lq(i+1) / lambda(i+1)
+
+    , where Lq(i+1) is mean number of patients waiting for a unit of the next station and
+    lambda(i+1) its accepted arrival rate, both from M/M/c/K queue with K = c(i+1) + c(i)
+    (patients waiting for the next station hold units of the current one). Preparation has
+    unlimited arrival queue, its length is approximated with Allen-Cunneen formula:
+
+        Lq = lambda * C(c, a) / (c / S' - lambda) * (ca^2 + cs^2) / 2
+
+    , where C is Erlang C formula (probability that all units are busy).
+
+    Deaths of patients are ignored, so estimates are conservative (overestimate load).
+    Estimates are named as corresponding statistics of a replication.
+
+"""
+
+def erlang_c(servers, load):
+    """
+        Returns probability that all <servers> are busy (Erlang C) with offered <load> (arrival rate x service time).
+    """
+    if load >= servers:
+        return 1.0
+    blocking = 1.0
+    for k in range(1, servers + 1):
+        blocking = load * blocking / (k + load * blocking)
+    return servers * blocking / (servers - load * (1.0 - blocking))
+
+
+def finite_queue(servers, capacity, load):
+    """
+        Returns probability that all <servers> are busy, mean number of waiting customers and probability
+        that the system is full in M/M/c/K queue with <capacity> (K) and offered <load>.
+    """
+    probabilities = [1.0]
+    for n in range(1, capacity + 1):
+        probabilities.append(probabilities[-1] * load / min(n, servers))
+    total = sum(probabilities)
+    busy = sum(probabilities[servers:]) / total
+    waiting = sum((n - servers) * p for n, p in enumerate(probabilities) if n > servers) / total
+    return busy, waiting, probabilities[-1] / total
+
+
+class QueueEstimate:
+    """
+        Analytic estimate of statistics of single scenario.
+    """
+    NAMES = ("usage_of_operation_unit", "idle-capacity-preparation", "all-recovery-units-busy", "rate-blocking-operations", "arrival-queue-length", "mean_time_per_patient")
+
+    def __init__(self, parameters, patient_types):
+        """
+            Computes estimate from scenario <parameters> and <patient_types>.
+        """
+        rate = 1.0 / parameters["patient-interval"].get_mean()
+        units = [parameters[p] for p in ("number-of-preparation-units", "number-of-operation-units", "number-of-recovery-units")]
+        total = sum(c.portion for c in patient_types.values())
+
+        # Mean and second moment of service times (mixture of scaled base times):
+        means, moments = [], []
+        for i, name in enumerate(("base-preparation-time", "base-operation-time", "base-recovery-time")):
+            base = parameters[name]
+            means.append(sum(c.portion * c.service_times[i] for c in patient_types.values()) / total * base.get_mean())
+            moments.append(sum(c.portion * c.service_times[i] ** 2 for c in patient_types.values()) / total * (base.get_variance() + base.get_mean() ** 2))
+
+        # Effective service times with blocking, starting from the last station:
+        self.service_times = [0.0, 0.0, means[2]]
+        self.busy = [0.0, 0.0, 0.0]
+        for i in (1, 0):
+            busy, waiting, full = finite_queue(units[i + 1], units[i + 1] + units[i], rate * self.service_times[i + 1])
+            self.busy[i + 1] = busy
+            self.service_times[i] = means[i] + waiting / (rate * (1.0 - full)) if full < 1.0 else float('inf')
+        self.busy[0] = erlang_c(units[0], rate * self.service_times[0])
+        self.utilization = [rate * s / c for s, c in zip(self.service_times, units)]
+        self.feasible = all(u < 1.0 for u in self.utilization)
+
+        if self.feasible:
+            variation = (parameters["patient-interval"].get_variance() * rate ** 2 + moments[0] / means[0] ** 2 - 1.0) / 2.0
+            waiting = self.busy[0] / (units[0] / self.service_times[0] - rate) * variation
+            queue, time = rate * waiting, waiting + sum(self.service_times)
+        else:
+            queue, time = float('inf'), float('inf')
+
+        self.statistics = {
+            "usage_of_operation_unit":   min(1.0, self.utilization[1]) * 100.0,
+            "idle-capacity-preparation": max(0.0, units[0] * (1.0 - self.utilization[0])),
+            "all-recovery-units-busy":   self.busy[2] * 100.0,
+            "rate-blocking-operations":  self.busy[2] * 100.0,
+            "arrival-queue-length":      queue,
+            "mean_time_per_patient":     time,
+        }
+
+
+    def __repr__(self):
+        return ", ".join("{}: {:.3f}".format(name, value) for name, value in self.statistics.items())
+
+
+    @staticmethod
+    def get_as_csv(scenarios, estimates, simulated, decimal_delimeter=","):
+        """
+            Returns single csv table with one row per scenario (swept values of <scenarios>, <estimates>
+            and whether scenario is <simulated>).
+        """
+        parameters = list(dict.fromkeys(name for values in scenarios for name in values.keys()))
+        titles = ["scenario"] + parameters + ["simulated"] + list(QueueEstimate.NAMES)
+        rows = []
+        for i, (values, estimate, selected) in enumerate(zip(scenarios, estimates, simulated)):
+            row = [str(i)] + [str(values.get(p, "")) for p in parameters] + [str(int(selected))]
+            rows.append(row + [str(estimate.statistics[name]).replace(".", decimal_delimeter) for name in QueueEstimate.NAMES])
+        return "SEP=;\n" + ";".join(titles) + "\n" + "\n".join([";".join(r) for r in rows])
+
+
+
+class EstimateFilter:
+    """
+        Class for parsing and storing user provided bounds of estimated statistics.
+        Format: {<statistic name>: [<lower bound>, <upper bound>]}.
+    """
+
+    def __init__(self, string):
+        self.bounds = {name: (float(bounds[0]), float(bounds[1])) for name, bounds in ast.literal_eval(string).items()}
+        for name in self.bounds.keys():
+            if name not in QueueEstimate.NAMES:
+                raise ValueError("Statistics '{}' can't be estimated.".format(name))
+
+
+    def __repr__(self):
+        return repr({name: list(bounds) for name, bounds in self.bounds.items()})
+
+
+    def __len__(self):
+        return len(self.bounds)
+
+
+    def accepts(self, estimate):
+        """
+            Returns True if <estimate> is feasible and within all bounds.
+        """
+        return estimate.feasible and all(low <= estimate.statistics[name] <= high for name, (low, high) in self.bounds.items())
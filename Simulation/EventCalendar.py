@@ -0,0 +1,216 @@
+from Simulation.Patients import IN_PREPARATION, PREPARED, IN_OPERATION, OPERATED, IN_RECOVERY, RECOVERED, DECEASED
+from Core.Statistics.Statistics import *
+from heapq import heappush, heappop
+from itertools import count
+
+"""
+    Event calendar engine
+
+    Alternative to SimPy for the surgery facility. Events are plain (time, sequence, callback, args)
+    records in a binary heap and patients are moved through the phases by callbacks instead of
+    generator processes:
+
+    - EventCalendar  binary heap of timed callbacks, also drives generators yielding delays
+    - Units          limited resources of a single phase with a prioritized queue, calls
+                     monitor whenever count of used units changes
+    - SurgeryPipeline  Preparation -> Operation -> Recovery flow with blocking, priorities and deaths
+
+    Flow follows the SimPy phases (see Phases module): a patient keeps its current unit until
+    the next unit is reserved, after which the reservation is released and the next unit is
+    requested again with the same priority.
+
+    Performance: the engine removes SimPy processes and resource requests, but the per-patient
+    path shared with SimPy (patient generation, status callbacks and statistics updates) is
+    the same, and in pure Python it bounds the speedup to about 4x patients per second on the
+    high-load benchmark (see benchmark.py), not an order of magnitude.
+
+"""
+
+class EventCalendar:
+    """
+        Binary heap based event calendar.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.processed = 0
+        self.__events = []
+        self.__sequence = count()
+
+
+    def schedule(self, delay, callback, *args):
+        """
+            Schedules <callback> to be called with <args> after <delay> hours.
+        """
+        heappush(self.__events, (self.now + delay, next(self.__sequence), callback, args))
+
+
+    def start(self, generator):
+        """
+            Starts driving <generator> that yields delays (in hours) between its steps.
+        """
+        def step():
+            try:
+                self.schedule(next(generator), step)
+            except StopIteration:
+                pass
+        self.schedule(0, step)
+
+
+    def run(self, until):
+        """
+            Processes events until time <until> (events at time <until> are not processed).
+        """
+        events = self.__events
+        processed = 0
+        while events and events[0][0] < until:
+            self.now, _, callback, args = heappop(events)
+            callback(*args)
+            processed += 1
+        self.processed += processed
+        self.now = until
+
+
+
+class Units:
+    """
+        Limited resources of single phase with prioritized queue of pending requests.
+    """
+    __slots__ = ("capacity", "count", "queue", "monitor")
+
+    def __init__(self, capacity, monitor):
+        self.capacity = capacity
+        self.count = 0
+        self.queue = []
+        self.monitor = monitor
+
+
+
+class SurgeryPipeline:
+    """
+        Preparation -> Operation -> Recovery flow of patients on event calendar.
+    """
+
+    def __init__(self, calendar, preparation, operation, recovery, patient_generator):
+        """
+            Creates pipeline with <preparation>, <operation> and <recovery> units on <calendar>,
+            patients are generated by <patient_generator>.
+        """
+        self.calendar = calendar
+        self.preparation = preparation
+        self.operation = operation
+        self.recovery = recovery
+        self.__generator = patient_generator
+        self.__sequence = count()
+
+
+    def start(self):
+        """
+            Starts generating patients.
+        """
+        self.calendar.schedule(0, self.__arrival, None)
+
+
+    def __arrival(self, interval):
+        """
+            Generates new patient and schedules next arrival.
+        """
+        if interval is not None:
+            Statistics.update_sample("patient-generator-interval", interval)
+
+        patient = self.__generator._generate_new_patient(self.calendar)
+        self.__request(self.preparation, patient, self.__prepare)
+
+        interval = self.__generator._interval.next()
+        self.calendar.schedule(interval, self.__arrival, interval)
+
+
+    def __request(self, units, patient, granted):
+        """
+            Requests unit from <units> for <patient>. Callback <granted> is called once unit is granted.
+        """
+        heappush(units.queue, (patient.priority, self.calendar.now, next(self.__sequence), granted, patient))
+        self.__dispatch(units)
+
+
+    def __release(self, units):
+        """
+            Releases single unit of <units>.
+        """
+        units.count -= 1
+        units.monitor()
+        self.__dispatch(units)
+
+
+    def __dispatch(self, units):
+        """
+            Grants free units to pending requests in order of priority.
+        """
+        while units.count < units.capacity and units.queue:
+            _, _, _, granted, patient = heappop(units.queue)
+            units.count += 1
+            units.monitor()
+            granted(patient)
+
+
+    def __prepare(self, patient):
+        patient.update_status(IN_PREPARATION, self.calendar.now)
+        time_to_live = patient.get_time_to_live(self.calendar.now)
+        if time_to_live <= patient.preparation_time:
+            self.calendar.schedule(max(0, time_to_live), self.__decease, patient, self.preparation)
+        else:
+            self.calendar.schedule(patient.preparation_time, self.__prepared, patient)
+
+
+    def __prepared(self, patient):
+        patient.update_status(PREPARED, self.calendar.now)
+        self.__request(self.operation, patient, self.__reserve_operation)
+
+
+    def __reserve_operation(self, patient):
+        """
+            Operation unit reserved: release reservation and preparation unit, request operation unit.
+        """
+        self.operation.count -= 1
+        self.operation.monitor()
+        self.__request(self.operation, patient, self.__operate)
+        self.__release(self.preparation)
+
+
+    def __operate(self, patient):
+        patient.update_status(IN_OPERATION, self.calendar.now)
+        time_to_live = patient.get_time_to_live(self.calendar.now)
+        if time_to_live <= patient.operation_time:
+            self.calendar.schedule(max(0, time_to_live), self.__decease, patient, self.operation)
+        else:
+            self.calendar.schedule(patient.operation_time, self.__operated, patient)
+
+
+    def __operated(self, patient):
+        patient.update_status(OPERATED, self.calendar.now)
+        self.__request(self.recovery, patient, self.__reserve_recovery)
+
+
+    def __reserve_recovery(self, patient):
+        """
+            Recovery unit reserved: release reservation and operation unit, request recovery unit.
+        """
+        self.recovery.count -= 1
+        self.recovery.monitor()
+        self.__request(self.recovery, patient, self.__recover)
+        self.__release(self.operation)
+
+
+    def __recover(self, patient):
+        patient.update_status(IN_RECOVERY, self.calendar.now)
+        self.calendar.schedule(patient.recovery_time, self.__recovered, patient)
+
+
+    def __recovered(self, patient):
+        patient.update_status(RECOVERED, self.calendar.now)
+        self.__release(self.recovery)
+
+
+    def __decease(self, patient, units):
+        patient.update_status(DECEASED, self.calendar.now)
+        self.__release(units)
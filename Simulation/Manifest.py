@@ -0,0 +1,65 @@
+import json
+import os
+
+"""
+    Manifest module
+
+    JobManifest records samples of each completed simulation run into manifest file
+    (manifest.jsonl in result folder), one json line per run:
+
+        {"scenario": <scenario key>, "run": <run>, "samples": {<statistic>: [<values>, <counts>]}}
+
+    Scenario key identifies parameters that affect samples of a run (see Simulation), so
+    completed runs are found even if scenarios of a sweep are reordered. Lines are appended
+    and flushed to disk after each run; incomplete last line (interrupted write) is dropped
+    when manifest is resumed. Floats are written with round-trip precision, so that resumed
+    job reproduces exactly the same aggregate statistics.
+
+"""
+
+class JobManifest:
+    """
+        Append-only manifest of completed simulation runs.
+    """
+
+    def __init__(self, path, resume=False):
+        """
+            Creates new manifest <path> or, if <resume> is set, continues existing one.
+        """
+        self.__completed = {}
+        if resume and path.exists():
+            with open(path, "rb") as file:
+                content = file.read()
+            length = content.rfind(b"\n") + 1
+            for line in content[:length].splitlines():
+                entry = json.loads(line)
+                self.__completed[(entry["scenario"], entry["run"])] = {name: tuple(samples) for name, samples in entry["samples"].items()}
+            # Drop incomplete last line:
+            os.truncate(path, length)
+        self.__file = open(path, "a" if resume else "w")
+
+
+    def __len__(self):
+        return len(self.__completed)
+
+
+    def get(self, scenario, run):
+        """
+            Returns samples of completed <run> of <scenario> (None if the run is not completed).
+        """
+        return self.__completed.get((scenario, run))
+
+
+    def add(self, scenario, run, samples):
+        """
+            Records <samples> (values and counts by statistic name) of completed <run> of <scenario>.
+        """
+        entry = {"scenario": scenario, "run": run, "samples": {name: [list(values), list(counts)] for name, (values, counts) in samples.items()}}
+        self.__file.write(json.dumps(entry) + "\n")
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__completed[(scenario, run)] = samples
+
+
+    def close(self):
+        self.__file.close()
@@ -0,0 +1,208 @@
+from Core.Statistics.Statistics import ConfidenceInterval
+from Core.Exceptions import SimulationException
+from Simulation.Sweep import SweepGrid
+from enum import IntEnum
+import ast
+import math
+
+"""
+    Optimizer module
+
+    Search for the cheapest unit configuration (smallest total number of units) that meets
+    constraints on statistics, e.g. blocking rate below 2% and arrival queue below 1:
+
+        optimization-constraints: {"rate-blocking-operations": [0, 2], "arrival-queue-length": [0, 1]}
+        optimization-units: {"number-of-preparation-units": [2, 6], "number-of-recovery-units": [3, 8]}
+
+    Candidates are all combinations of unit counts within given ranges. Candidates are
+    examined in order of cost: all candidates of the cheapest cost level are simulated until
+    each of them is classified with 95% confidence:
+
+    - FEASIBLE:   confidence intervals of all constrained statistics lie within bounds
+    - INFEASIBLE: confidence interval of some constrained statistic lies outside its bounds
+
+    Additional runs of each round are allocated to undecided candidates in proportion to
+    (s / d)^2 (OCBA allocation for feasibility determination), where d is distance of the
+    mean from the nearest bound and s standard error of the mean, so runs go to candidates
+    that are close to the bounds. Once a candidate of the level is feasible, it is the
+    optimum. If all candidates of the level are infeasible, search continues on the next
+    level. Analytic estimate (see Estimator module) is an approximation, so candidates that
+    are estimated to be infeasible are not skipped, only deferred: they are simulated once
+    the other candidates of their level are infeasible.
+
+"""
+
+class CandidateStatus(IntEnum):
+    """
+        Classification of optimization candidates.
+    """
+    UNDECIDED  = 0
+    FEASIBLE   = 1
+    INFEASIBLE = 2
+    ESTIMATED  = 3
+
+
+class OptimizationConstraints:
+    """
+        Class for parsing and storing user provided constraints of statistics.
+        Format: {<statistic name>: [<lower bound>, <upper bound>]}.
+    """
+
+    def __init__(self, string):
+        self.bounds = {name: (float(bounds[0]), float(bounds[1])) for name, bounds in ast.literal_eval(string).items()}
+
+
+    def __repr__(self):
+        return repr({name: list(bounds) for name, bounds in self.bounds.items()})
+
+
+    def __len__(self):
+        return len(self.bounds)
+
+
+    def validate(self, names):
+        """
+            Checks that constrained statistics exist in <names>.
+        """
+        for name in self.bounds.keys():
+            if name not in names:
+                raise SimulationException("Statistics '{}' doesn't exist.".format(name))
+
+
+    def classify(self, statistics, level=ConfidenceInterval.CONFIDENCE_95):
+        """
+            Returns status of candidate with <statistics> (dictionary of sample collections) and
+            OCBA weight (squared ratio of standard error to distance from the nearest bound).
+        """
+        status, weight = CandidateStatus.FEASIBLE, 0.0
+        for name, (low, high) in self.bounds.items():
+            try:
+                mean, half_width = statistics[name].get_mean(), statistics[name].get_confidence_interval(level)
+            except (ZeroDivisionError, ValueError):
+                return CandidateStatus.UNDECIDED, float('inf')
+            if math.isnan(mean) or math.isnan(half_width):
+                return CandidateStatus.UNDECIDED, float('inf')
+            if mean + half_width < low or mean - half_width > high:
+                return CandidateStatus.INFEASIBLE, 0.0
+            if mean - half_width < low or mean + half_width > high:
+                status = CandidateStatus.UNDECIDED
+                distance = min(abs(mean - low), abs(mean - high))
+                weight = max(weight, (half_width / (level / 1000.0) / distance) ** 2 if distance > 0 else float('inf'))
+        return status, weight
+
+
+
+class UnitRanges:
+    """
+        Class for parsing and storing user provided ranges of unit counts.
+        Format: {<unit parameter name>: [<min>, <max>]}.
+    """
+    NAMES = ("number-of-preparation-units", "number-of-operation-units", "number-of-recovery-units")
+
+    def __init__(self, string):
+        self.ranges = {name: (int(r[0]), int(r[1])) for name, r in ast.literal_eval(string).items()}
+        for name, (low, high) in self.ranges.items():
+            if name not in UnitRanges.NAMES or not 1 <= low <= high:
+                raise ValueError("Invalid range of units '{}'.".format(name))
+
+
+    def __repr__(self):
+        return repr({name: list(r) for name, r in self.ranges.items()})
+
+
+    def get_grid(self):
+        """
+            Returns sweep grid of all combinations of unit counts.
+        """
+        return SweepGrid(repr({name: list(range(low, high + 1)) for name, (low, high) in self.ranges.items()}))
+
+
+
+class Candidate:
+    """
+        Single unit configuration (scenario index, swept <values> and number of runs).
+    """
+
+    def __init__(self, index, values, units):
+        self.index = index
+        self.values = values
+        self.units = units
+        self.cost = sum(units)
+        self.runs = 0
+        self.status = CandidateStatus.UNDECIDED
+        self.weight = float('inf')
+        self.statistics = None
+
+
+
+class UnitOptimizer:
+    """
+        Cost-ordered search with OCBA allocation of runs (see module description).
+    """
+
+    def __init__(self, constraints, candidates):
+        """
+            Creates optimizer of <candidates> (list of Candidate) under <constraints>.
+        """
+        self.constraints = constraints
+        self.candidates = candidates
+
+
+    def get_level(self):
+        """
+            Returns candidates of the cheapest cost level that is not completely infeasible (empty if none left).
+            Candidates estimated to be infeasible are returned only if no other candidate of the level remains.
+        """
+        remaining = [c for c in self.candidates if c.status in (CandidateStatus.UNDECIDED, CandidateStatus.FEASIBLE, CandidateStatus.ESTIMATED)]
+        if len(remaining) == 0:
+            return []
+        cost = min(c.cost for c in remaining)
+        level = [c for c in remaining if c.cost == cost]
+        return [c for c in level if c.status is not CandidateStatus.ESTIMATED] or level
+
+
+    def get_optimum(self):
+        """
+            Returns feasible candidate of the cheapest level (the one with the most runs if many) or None.
+        """
+        feasible = [c for c in self.get_level() if c.status is CandidateStatus.FEASIBLE]
+        return max(feasible, key=lambda c: c.runs) if feasible else None
+
+
+    def update(self, candidate, statistics, runs):
+        """
+            Classifies <candidate> from its <statistics> after <runs> runs.
+        """
+        candidate.runs, candidate.statistics = runs, statistics
+        candidate.status, candidate.weight = self.constraints.classify(statistics)
+
+
+    def allocate(self, candidates, increment):
+        """
+            Allocates <increment> runs among undecided <candidates> in proportion to their OCBA weights.
+            Returns dictionary of additional runs by candidate.
+        """
+        undecided = [c for c in candidates if c.status is CandidateStatus.UNDECIDED]
+        if len(undecided) == 0:
+            return {}
+        infinite = [c for c in undecided if c.weight == float('inf')]
+        if infinite:
+            return {c: max(1, increment // len(infinite)) for c in infinite}
+        total = sum(c.weight for c in undecided)
+        allocation = {c: round(increment * c.weight / total) for c in undecided}
+        allocation[max(undecided, key=lambda c: c.weight)] += increment - sum(allocation.values())
+        return {c: runs for c, runs in allocation.items() if runs > 0}
+
+
+    def get_as_csv(self, decimal_delimeter=","):
+        """
+            Returns single csv table with one row per candidate: unit counts, cost, runs, status and
+            mean of each constrained statistic.
+        """
+        names = list(self.constraints.bounds.keys())
+        titles = ["scenario"] + list(UnitRanges.NAMES) + ["cost", "runs", "status"] + names
+        rows = []
+        for c in self.candidates:
+            means = [str(c.statistics[name].get_mean() if c.statistics is not None and len(c.statistics[name]) != 0 else float('nan')).replace(".", decimal_delimeter) for name in names]
+            rows.append([str(c.index)] + [str(u) for u in c.units] + [str(c.cost), str(c.runs), c.status.name] + means)
+        return "SEP=;\n" + ";".join(titles) + "\n" + "\n".join([";".join(r) for r in rows])
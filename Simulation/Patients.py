@@ -1,23 +1,39 @@
 from Core.Logging.Logging import SimLogger as Logger, LogLevel
 from Core.Distributions import RandomGenerator as Random
 from Core.Statistics.Statistics import *
-from enum import Enum
+from collections import deque
+from enum import Enum, IntEnum
+from array import array
+import bisect
 import ast
 import sys
 
-class PatientStatus(Enum):
+class PatientStatus(IntEnum):
     """
-        Enum for patient status.
+        Enum for patient status. Value is index of the status in time stamps of patient record.
     """
-    WAITING        = 0,
-    IN_PREPARATION = 1,
-    PREPARED       = 2,
-    IN_OPERATION   = 3,
-    OPERATED       = 4,
-    IN_RECOVERY    = 5,
-    RECOVERED      = 6,
-    DECEASED       = 7,
-    
+    WAITING        = 0
+    IN_PREPARATION = 1
+    PREPARED       = 2
+    IN_OPERATION   = 3
+    OPERATED       = 4
+    IN_RECOVERY    = 5
+    RECOVERED      = 6
+    DECEASED       = 7
+
+
+# Statuses as module level names for hot paths (attribute access of enum members is comparatively slow):
+WAITING, IN_PREPARATION, PREPARED, IN_OPERATION, OPERATED, IN_RECOVERY, RECOVERED, DECEASED = PatientStatus
+
+
+class RecordRetention(Enum):
+    """
+        Retention policy for records of patients that have exited (recovered or deceased).
+    """
+    DROP_ON_EXIT  = 0,
+    KEEP_LAST     = 1,
+    SPILL_TO_DISK = 2
+
 
 
 class PatientCondition:
@@ -39,54 +55,90 @@ class PatientCondition:
 
 class PatientRecord:
     """
-        Patient record (a.k.a patient).
+        Patient record (a.k.a patient). Time stamps are stored in fixed-size array indexed by status.
     """
-    def __init__(self, id, time_stamp, patient_status_changed_callback, priority, times, time_to_live):
+    __slots__ = ("id", "time_stamps", "_records", "preparation_time", "operation_time", "recovery_time", "priority", "condition", "__time_to_live")
+
+    def __init__(self, id, time_stamp, records, priority, times, time_to_live, condition=None):
         self.id = id
-        self.time_stamps = dict()
-        self._callback = patient_status_changed_callback
-        self.update_status(PatientStatus.WAITING, time_stamp)
-        self.preparation_time = times[PatientStatus.IN_PREPARATION]
-        self.operation_time   = times[PatientStatus.IN_OPERATION] 
-        self.recovery_time    = times[PatientStatus.IN_RECOVERY]
+        self.time_stamps = array('d', PatientRecord._NO_TIME_STAMPS)
+        self._records = records
+        self.preparation_time = times[IN_PREPARATION]
+        self.operation_time   = times[IN_OPERATION] 
+        self.recovery_time    = times[IN_RECOVERY]
         self.priority = priority
+        self.condition = condition
         self.__time_to_live = time_to_live
+        self.update_status(WAITING, time_stamp)
 
 
     def update_status(self, status, time_stamp):
         self.time_stamps[status] = time_stamp
-        Logger.log(LogLevel.DEBUG, "Patient (id: " + str(self.id) + ") is " + str(status).split(".")[1].lower().replace("_", " ") + ".")
-        self._callback(status, self, time_stamp)
+        Logger.log(LogLevel.DEBUG, "Patient (id: {}) is {}.", self.id, PatientRecord._STATUS_NAMES[status])
+        self._records._on_status_changed(status, self, time_stamp)
 
 
     def get_time_to_live(self, time_now):
-        return self.__time_to_live - (time_now - self.time_stamps[PatientStatus.WAITING])
+        return self.__time_to_live - (time_now - self.time_stamps[WAITING])
+
+
+PatientRecord._NO_TIME_STAMPS = [float("nan")] * len(PatientStatus)
+PatientRecord._STATUS_NAMES = [s.name.lower().replace("_", " ") for s in PatientStatus]
 
 
 class PatientRecords:
     """
-        Class handling patient statistics collecting. TODO: Could remove recovered patients by wrapping callback.
+        Class handling patient statistics collecting. Records of active patients are referenced only
+        by the simulation, records of exited patients are handled by retention policy:
+        - DROP_ON_EXIT:  records are dropped
+        - KEEP_LAST:     last <kept> records are kept in memory
+        - SPILL_TO_DISK: records are written into <spill_file> (csv)
     """
     _NEXT_ID = 0
 
-    def __init__(self, patient_status_changed_callback):
-        self._patients = []
+    def __init__(self, patient_status_changed_callback, retention=RecordRetention.DROP_ON_EXIT, kept=0, spill_file=None):
+        self._patients = deque(maxlen=kept if retention is RecordRetention.KEEP_LAST else 0)
         self._callback = patient_status_changed_callback
-        self.__random = Random.new_generator()     # Independent RNG to randomize patient's time to live.
+        self.__random = Random.new_generator("time-to-live")     # Independent RNG to randomize patient's time to live.
+        self.__spill = None
+        if retention is RecordRetention.SPILL_TO_DISK:
+            self.__spill = open(spill_file, "w")
+            self.__spill.write("id;priority;" + ";".join(s.name.lower() for s in PatientStatus) + "\n")
 
 
-    def add_patient(self, urgency, death_rate, times, time_stamp):
+    def add_patient(self, urgency, death_rate, times, time_stamp, condition=None):
         """
             Adds (creates) new patient record to patient record collection.
         """
         # Time until patient is operated (when no waiting): 
         time_to_live = float("inf")
         if death_rate > 0:
-            time_to_live = self.__random.uniform(0, (1.0 / death_rate) * (times[PatientStatus.IN_PREPARATION] + times[PatientStatus.IN_OPERATION]))
+            time_to_live = self.__random.uniform(0, (1.0 / death_rate) * (times[IN_PREPARATION] + times[IN_OPERATION]))
 
-        self._patients.append(PatientRecord(PatientRecords._NEXT_ID, time_stamp, self._callback, urgency, times, time_to_live))
+        patient = PatientRecord(PatientRecords._NEXT_ID, time_stamp, self, urgency, times, time_to_live, condition)
         PatientRecords._NEXT_ID += 1
-        return self._patients[-1]
+        return patient
+
+
+    def close(self):
+        """
+            Closes spill file (if any).
+        """
+        if self.__spill is not None:
+            self.__spill.close()
+            self.__spill = None
+
+
+    def _on_status_changed(self, status, patient, time_stamp):
+        """
+            Forwards status change to callback and applies retention policy to exited patients.
+        """
+        self._callback(status, patient, time_stamp)
+        if status is RECOVERED or status is DECEASED:
+            if self.__spill is not None:
+                self.__spill.write("{};{};{}\n".format(patient.id, patient.priority, ";".join(map(str, patient.time_stamps))))
+            else:
+                self._patients.append(patient)
 
 
 
@@ -100,17 +152,21 @@ class PatientGenerator:
         self._patients = patient_records
         self.__patient_types = patient_types
         self.__base_times = base_times
-        self.__random = Random.new_generator()     # Independent RNG to randomize patient condition.
+        self.__random = Random.new_generator("patient-condition")     # Independent RNG to randomize patient condition.
 
         sum_of_probabilities = sum(self.__patient_types[k].portion for k in self.__patient_types.keys())
 
-        # Store probabilites to generate certain type in a lookup table:
+        # Store cumulative probabilites to generate certain type in a lookup table:
         self.__generator_table = []
         probability_accum = 0.0
         for k, v in self.__patient_types.items():
             probability_accum += (v.portion / sum_of_probabilities)
-            self.__generator_table.append([probability_accum, k])
-        self.__generator_table[-1][0] = 1.0
+            self.__generator_table.append(probability_accum)
+        self.__generator_table[-1] = 1.0
+        self.__conditions = list(self.__patient_types.keys())
+
+        # Names of portion statistics and their values for each generated condition:
+        self.__portions = {k: [("patient-portion-" + c, 100.0 if c == k else 0.0) for c in self.__conditions] for k in self.__conditions}
 
 
 
@@ -138,23 +194,26 @@ class PatientGenerator:
         """
 
         # Randomize patient properties (condition from uniform distribution and service times from exponential distribution):
+        Random.next_patient()
         random_uniform = self.__random.uniform(0.0, 1.0)
-        condition = next(t for t in self.__generator_table if random_uniform < t[0])[1]
+        condition = self.__conditions[bisect.bisect_right(self.__generator_table, random_uniform)]
+        patient_type = self.__patient_types[condition]
         times = {
-          PatientStatus.IN_PREPARATION: self.__base_times[PatientStatus.IN_PREPARATION].next() * self.__patient_types[condition].service_times[0],
-          PatientStatus.IN_OPERATION:   self.__base_times[PatientStatus.IN_OPERATION].next() * self.__patient_types[condition].service_times[1],
-          PatientStatus.IN_RECOVERY:    self.__base_times[PatientStatus.IN_RECOVERY].next() * self.__patient_types[condition].service_times[2]
+          IN_PREPARATION: self.__base_times[IN_PREPARATION].next() * patient_type.service_times[0],
+          IN_OPERATION:   self.__base_times[IN_OPERATION].next() * patient_type.service_times[1],
+          IN_RECOVERY:    self.__base_times[IN_RECOVERY].next() * patient_type.service_times[2]
         }
 
         # Update statistic:
-        [Statistics.update_sample("patient-portion-" + k, 100.0 if k == condition else 0.0) for k in self.__patient_types.keys()]
-        Statistics.update_sample("mean-in-preparation-time", times[PatientStatus.IN_PREPARATION])
-        Statistics.update_sample("mean-in-operation-time", times[PatientStatus.IN_OPERATION])
-        Statistics.update_sample("mean-in-recovery-time", times[PatientStatus.IN_RECOVERY])
+        for name, portion in self.__portions[condition]:
+            Statistics.update_sample(name, portion)
+        Statistics.update_sample("mean-in-preparation-time", times[IN_PREPARATION])
+        Statistics.update_sample("mean-in-operation-time", times[IN_OPERATION])
+        Statistics.update_sample("mean-in-recovery-time", times[IN_RECOVERY])
         Statistics.update_sample("total-number-of-patients")
 
         # Add patient to patient records:
-        patient = self._patients.add_patient(self.__patient_types[condition].urgency, self.__patient_types[condition].death_rate, times, env.now)
-        Logger.log(LogLevel.DEBUG, "Created new patient (id: {}) in {} condition and with time to live {}.".format(patient.id, condition, patient.get_time_to_live(env.now)))
+        patient = self._patients.add_patient(patient_type.urgency, patient_type.death_rate, times, env.now, condition)
+        Logger.is_enabled(LogLevel.DEBUG) and Logger.log(LogLevel.DEBUG, "Created new patient (id: {}) in {} condition and with time to live {}.", patient.id, condition, patient.get_time_to_live(env.now))
         return patient
 
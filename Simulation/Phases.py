@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
-from Simulation.Patients import PatientRecord, PatientStatus
+from Simulation.Patients import PatientRecord, IN_PREPARATION, PREPARED, IN_OPERATION, OPERATED, IN_RECOVERY, RECOVERED, DECEASED
+from enum import IntEnum
+import simpy
 
 """
     Different simulation phases:
@@ -7,8 +9,40 @@ from Simulation.Patients import PatientRecord, PatientStatus
     - Operation
     - Recovery
 
+    Patient is moved through the phases either by nested processes (enter_phase) or
+    by single flat process per patient (run_lifecycle).
+
 """
 
+class PatientLifecycle(IntEnum):
+    """
+        Supported ways to move patient through the phases.
+    """
+    NESTED = 0
+    FLAT   = 1
+
+
+class MonitoredResource(simpy.PriorityResource):
+    """
+        Priority resource that calls <monitor> whenever count of used units changes.
+    """
+
+    def __init__(self, env, capacity, monitor):
+        super().__init__(env, capacity)
+        self.monitor = monitor
+
+    def _do_put(self, event):
+        result = super()._do_put(event)
+        if event.triggered:
+            self.monitor()
+        return result
+
+    def _do_get(self, event):
+        result = super()._do_get(event)
+        self.monitor()
+        return result
+
+
 class SimulationPhase(metaclass=ABCMeta):
     """
         Simple base class for simulation phases.
@@ -17,6 +51,7 @@ class SimulationPhase(metaclass=ABCMeta):
     def __init__(self, next_phase, resources = None):
         self.next_phase = next_phase
         self.resources = resources
+        self.processes = 0          # Number of SimPy processes created by the phase.
     
 
     @abstractmethod
@@ -35,6 +70,9 @@ class SimulationPhase(metaclass=ABCMeta):
             - moving to next phase
         """
 
+        # Process of this method and process executing the phase:
+        self.processes += 2
+
         # If limited resources, needs to wait until resources are available:
         if self.resources is not None:
             with self.resources.request(priority=priority) as req:
@@ -53,6 +91,7 @@ class SimulationPhase(metaclass=ABCMeta):
         """
             Handles movement to next phase.
         """
+        self.processes += 1
         if self.next_phase is not None:
             if self.next_phase.resources is not None:
                 with self.next_phase.resources.request(priority=priority) as req:
@@ -62,6 +101,51 @@ class SimulationPhase(metaclass=ABCMeta):
                 yield env.process(self.next_phase.enter_phase(env, priority, patient))
 
 
+    def run_lifecycle(self, env, priority, patient):
+        """
+            Single process that takes care of the total execution of the patient starting from the
+            current phase. Resources of each phase are acquired and released in sequence, current
+            unit is kept until next unit is reserved (same blocking as with enter_phase).
+        """
+        self.processes += 1
+        phase = self
+        request = phase._request(env, priority)
+        yield request
+
+        while True:
+            cont = yield from phase.execute_phase(env, patient)
+            if not cont or phase.next_phase is None:
+                phase._release(request)
+                return
+
+            # Reserve next unit, then release reservation and current unit and request next unit again:
+            reservation = phase.next_phase._request(env, priority)
+            yield reservation
+            phase.next_phase._release(reservation)
+            next_request = phase.next_phase._request(env, priority)
+            phase._release(request)
+
+            phase, request = phase.next_phase, next_request
+            yield request
+
+
+    def _request(self, env, priority):
+        """
+            Requests unit with <priority>. Returns request event (zero timeout if unlimited resources).
+        """
+        if self.resources is None:
+            return env.timeout(0)
+        return self.resources.request(priority=priority)
+
+
+    def _release(self, request):
+        """
+            Releases unit reserved by <request>.
+        """
+        if self.resources is not None:
+            self.resources.release(request)
+
+
 class PreparationUnits(SimulationPhase):
     """
         Preparation units: prepares patient for a operation, limited resources.
@@ -70,14 +154,14 @@ class PreparationUnits(SimulationPhase):
         super().__init__(next_step, units)
 
     def execute_phase(self, env, patient):
-        patient.update_status(PatientStatus.IN_PREPARATION, env.now)
+        patient.update_status(IN_PREPARATION, env.now)
         if patient.get_time_to_live(env.now) <= patient.preparation_time:
             yield env.timeout(max(0, patient.get_time_to_live(env.now)))
-            patient.update_status(PatientStatus.DECEASED, env.now)
+            patient.update_status(DECEASED, env.now)
             return False
         else:
             yield env.timeout(patient.preparation_time)
-            patient.update_status(PatientStatus.PREPARED, env.now)
+            patient.update_status(PREPARED, env.now)
             return True
 
 
@@ -89,14 +173,14 @@ class OperationUnits(SimulationPhase):
         super().__init__(next_step, units)
 
     def execute_phase(self, env, patient):
-        patient.update_status(PatientStatus.IN_OPERATION, env.now)
+        patient.update_status(IN_OPERATION, env.now)
         if patient.get_time_to_live(env.now) <= patient.operation_time:
             yield env.timeout(max(0, patient.get_time_to_live(env.now)))
-            patient.update_status(PatientStatus.DECEASED, env.now)
+            patient.update_status(DECEASED, env.now)
             return False
         else:
             yield env.timeout(patient.operation_time)
-            patient.update_status(PatientStatus.OPERATED, env.now)
+            patient.update_status(OPERATED, env.now)
             return True
 
 
@@ -108,7 +192,7 @@ class RecoveryUnits(SimulationPhase):
         super().__init__(None, units)
 
     def execute_phase(self, env, patient):
-        patient.update_status(PatientStatus.IN_RECOVERY, env.now)
+        patient.update_status(IN_RECOVERY, env.now)
         yield env.timeout(patient.recovery_time)
-        patient.update_status(PatientStatus.RECOVERED, env.now)
+        patient.update_status(RECOVERED, env.now)
         return True
@@ -0,0 +1,413 @@
+from Simulation.Patients import PatientGenerator, PatientRecords, WAITING, IN_PREPARATION, PREPARED, IN_OPERATION, OPERATED, IN_RECOVERY, RECOVERED, DECEASED
+from Simulation.Phases import RecoveryUnits, OperationUnits, PreparationUnits, PatientLifecycle, MonitoredResource
+from Simulation.EventCalendar import EventCalendar, SurgeryPipeline, Units
+from Simulation.Trace import TraceRecorder, EventTrace, UNITS_PREPARATION, UNITS_OPERATION, UNITS_RECOVERY
+from Core.Logging.Logging import SimLogger as Logger, LogLevel
+from Core.Distributions import RandomGenerator as Random, VarianceReduction
+from Core.Statistics.Statistics import *
+from Core.Statistics.Analysis import WarmUpDetection, WarmUpDetector, SamplingMode, get_batch_size, merge_batches
+from Core.Profiling import Profiler
+from enum import IntEnum
+import simpy
+import time
+import math
+
+"""
+    Replication module
+
+    Replication is a single simulation run of the surgery facility with its own
+    simulation environment and random seed. Replication collects its samples into
+    the Statistics singleton and returns them once the run is completed, so that
+    replications can be executed either in the same process or in worker processes.
+
+    Replication is simulated either with SimPy processes (Phases module) or with plain
+    records on a binary-heap event calendar (EventCalendar module).
+
+    Warm-up is either fixed (sample-warm-up) or detected with MSER-5 from arrival queue
+    length and operation usage. With detection, total simulation time is known only after
+    warm-up, so the simulation is advanced in observation windows until it is detected.
+
+    In batch means sampling mode the whole post warm-up period (sample-count x sample-time)
+    is sampled into contiguous base batches of batch-base-time hours, which are merged into
+    batches at the end of the run (see Analysis module). Unmerged base batches are returned
+    for pilot runs of sample analysis.
+
+    Counters of each run (events processed, SimPy processes created by each phase, statistics
+    updates, log calls and wall time per sample) are logged at the end of the run and written
+    into profile report if the run is profiled (see Profiling module).
+
+"""
+
+class SimulationEngine(IntEnum):
+    """
+        Supported simulation engines.
+    """
+    SIMPY = 0
+    HEAP  = 1
+
+
+class Replication:
+    """
+        Single simulation run (replication) of TIES481 course surgery case.
+    """
+
+    def __init__(self, parameters, patient_types, run, merge=True, verbose=True, on_sample=None, scenario=0):
+        """
+            Creates replication number <run> of scenario <scenario> (index of scenario, e.g. in a sweep, used in
+            names of files written by the run) using <parameters> and <patient_types>. If <merge> is not set,
+            base batches of batch means sampling are returned as they are. Statistics of each sample are
+            printed into stdout if <verbose> is set. <on_sample> is called with run, sample index and values
+            of each statistic (by statistic name) when a sample (or base batch) is completed.
+        """
+        self.__parameters = parameters
+        self.__patient_types = patient_types
+        self.__run = run
+        self.__scenario = scenario
+        self.__merge = merge
+        self.__verbose = verbose
+        self.__on_sample = on_sample
+        self.__statistics = Replication.create_statistics(patient_types)
+
+
+    @staticmethod
+    def create_statistics(patient_types):
+        """
+            Creates empty sample collections for all statistics collected during single replication.
+        """
+        return {
+            **{ "patient-portion-" + k: SampleCollection(desc_l="True portion of {} patients".format(k), desc_s="portion_{}".format(k), unit="%") for k in patient_types.keys()},
+            "number_of_prepared":         SampleCollection(desc_l="Number of patients PREPARED in total",         desc_s="total_prepared",       type=Counter),
+            "number_of_operated":         SampleCollection(desc_l="Number of patients OPERATED in total",         desc_s="total_operated",       type=Counter),
+            "number_of_recovered":        SampleCollection(desc_l="Number of patients RECOVERED in total",        desc_s="total_recoved",        type=Counter),
+            "number_of_deceased":         SampleCollection(desc_l="Number of patients DECEASED in total",         desc_s="total_deceased",       type=Counter),
+            "total-number-of-patients":   SampleCollection(desc_l="Total number of patients generated.",          desc_s="total_patients",       type=Counter),
+            "patient-generator-interval": SampleCollection(desc_l="True interval of generating patients",         desc_s="interval_patients",    unit="hours"),
+            "mean_time_per_prepare":      SampleCollection(desc_l="Mean time spent from WAITING to PREPARED",     desc_s="from_wait_to_prep",    unit="hours"),
+            "mean_time_per_operate":      SampleCollection(desc_l="Mean time spent from PREPARED to OPERATED",    desc_s="from_prep_to_oper",    unit="hours"),
+            "mean_time_per_patient":      SampleCollection(desc_l="Mean time spent from WAITING to RECOVERED",    desc_s="from_wait_to_reco",    unit="hours"),
+            "mean-in-preparation-time":   SampleCollection(desc_l="Mean preparation time based on distribution.", desc_s="mean_prep_time_distr", unit="hours"),
+            "mean-in-operation-time":     SampleCollection(desc_l="Mean operation time based on distribution.",   desc_s="mean_oper_time_distr", unit="hours"),
+            "mean-in-recovery-time":      SampleCollection(desc_l="Mean recovery time based on distribution.",    desc_s="mean_oper_reco_distr", unit="hours"),
+            "usage_of_operation_unit":    SampleCollection(desc_l="Utilization of the operation theater",         desc_s="operation_usage",      unit="%", type=TimeWeighted),
+            "arrival-queue-length":       SampleCollection(desc_l="Patients at the arrival queue",                desc_s="arr_queue_length",               type=TimeWeighted),
+            "idle-capacity-preparation":  SampleCollection(desc_l="Idle capacity at prepration",                  desc_s="idle_capacity",                  type=TimeWeighted),
+            "rate-blocking-operations":   SampleCollection(desc_l="Moving to recovery blocked",                   desc_s="move_reco_blocked",    unit="%"),
+            "all-recovery-units-busy":    SampleCollection(desc_l="All recovery units are busy",                  desc_s="all_reco_busy",        unit="%", type=TimeWeighted),
+        }
+
+
+    @staticmethod
+    def get_run_count(parameters, runs):
+        """
+            Returns <runs> rounded up to whole pairs of runs with antithetic variance reduction.
+        """
+        if parameters["variance-reduction"] is VarianceReduction.ANTITHETIC:
+            return runs + runs % 2
+        return runs
+
+
+    @staticmethod
+    def merge_runs(parameters, patient_types, samples):
+        """
+            Merges <samples> of runs (in order of runs) into statistics of single scenario. With antithetic
+            variance reduction, samples of both runs of a pair are pooled into single observation, so that
+            confidence intervals benefit from negative correlation of the pair (unpaired last run is not used).
+        """
+        if parameters["variance-reduction"] is VarianceReduction.ANTITHETIC:
+            if len(samples) % 2 == 1:
+                Logger.log(LogLevel.WARNING, "Run {} has no antithetic pair and is not used.", len(samples) - 1)
+            samples = [{name: ([v1 + v2 for v1, v2 in zip(first[name][0], second[name][0])], [c1 + c2 for c1, c2 in zip(first[name][1], second[name][1])])
+                        for name in first} for first, second in zip(samples[0::2], samples[1::2])]
+        statistics = Replication.create_statistics(patient_types)
+        for name, stat in statistics.items():
+            [stat.extend(run_samples[name]) for run_samples in samples]
+        return statistics
+
+
+    def run(self):
+        """
+            Runs the replication (profiled if requested). Returns collected samples of each statistic by statistic name.
+        """
+        profiler = Profiler(self.__parameters["profile"])
+        log_calls = Logger.calls
+        start = time.perf_counter()
+        with profiler:
+            samples = self.__simulate()
+
+        self.counters = {
+            "wall-time":                time.perf_counter() - start,
+            "events":                   self.get_event_count(),
+            **{"processes-" + name: phase.processes for name, phase in zip(("preparation", "operation", "recovery"), self.__phases)},
+            "statistics-updates":       Statistics.updates,
+            "log-calls":                Logger.calls - log_calls,
+            "samples":                  len(self.__sample_times),
+            "mean-wall-time-per-sample": sum(self.__sample_times) / len(self.__sample_times) if self.__sample_times else 0.0,
+            "max-wall-time-per-sample":  max(self.__sample_times, default=0.0),
+        }
+        Logger.log(LogLevel.INFO, "Counters of run {}: {}.", self.__run, ", ".join("{}: {:.4f}".format(name, value) if isinstance(value, float) else "{}: {}".format(name, value) for name, value in self.counters.items()))
+        profiler.write(self.__parameters["result-folder"] / "profile_{}_{}".format(self.__scenario, self.__run), self.counters)
+        return samples
+
+
+    def __simulate(self):
+        """
+            Simulates the replication. Returns collected samples of each statistic by statistic name.
+        """
+        self.__verbose and print("-" * 150)
+        heap_engine = self.__parameters["simulation-engine"] is SimulationEngine.HEAP
+        self.__environment = EventCalendar() if heap_engine else simpy.Environment()
+        Logger.set_environment(self.__environment)
+        Logger.log(LogLevel.INFO, "Starting simulation run {}.", self.__run)
+
+        # Collect samples of this replication only:
+        Statistics()
+        Statistics.clear()
+        [Statistics.add_statistic(name, stat) for name, stat in self.__statistics.items()]
+
+        # Initialize RNG:
+        Random(self.__parameters["random-seed"], self.__run, self.__parameters["random-backend"], self.__parameters["variance-reduction"])
+
+        # Sampling of samples (or base batches in batch means mode):
+        self.__batch_means = self.__parameters["sampling"] is SamplingMode.BATCH_MEANS
+        self.__sampling = {p: self.__parameters[p] for p in ("sample-interval", "sample-time", "sample-count")}
+        if self.__batch_means:
+            base = self.__parameters["batch-base-time"]
+            self.__sampling = {"sample-interval": 0, "sample-time": base, "sample-count": max(1, self.__parameters["sample-count"] * self.__parameters["sample-time"] // base)}
+
+        # Calculate total simulation time (known after warm-up detection, if enabled):
+        self.__detector = None
+        self.__warm_up = self.__parameters["sample-warm-up"]
+        self.__simulation_time = self.__get_simulation_time()
+        if self.__parameters["warm-up-detection"] is WarmUpDetection.MSER5:
+            self.__detector = WarmUpDetector(("arrival-queue-length", "usage_of_operation_unit"), self.__parameters["warm-up-observation"])
+            self.__simulation_time = None
+
+        # Create event trace (if requested) and records:
+        self.__trace = None
+        if self.__parameters["event-trace"] is EventTrace.BINARY:
+            self.__trace = TraceRecorder(self.__parameters["result-folder"] / "trace_{}_{}.bin".format(self.__scenario, self.__run), {
+                "scenario":          self.__scenario,
+                "run":               self.__run,
+                "random-seed":       self.__parameters["random-seed"],
+                "conditions":        list(self.__patient_types.keys()),
+                "units":             [self.__parameters[p] for p in ("number-of-preparation-units", "number-of-operation-units", "number-of-recovery-units")],
+                "simulation-time":   self.__simulation_time,
+                "sample-warm-up":    self.__warm_up,
+                **self.__sampling
+            })
+        patient_records = PatientRecords(self.on_patient_status_changed if self.__trace is None else self.__on_patient_status_traced,
+                                         self.__parameters["patient-records"], self.__parameters["patient-records-kept"],
+                                         self.__parameters["result-folder"] / "patients_{}_{}.csv".format(self.__scenario, self.__run))
+
+        # Number of patients at arrival queue:
+        self.__arrival_queue = 0
+        self.__sample_times = []
+        self.__sample_start = None
+        self.__phases = ()
+
+        # Create patient generator:
+        patient_generator = PatientGenerator(self.__parameters["patient-interval"].initialize("patient-interval"), patient_records, {
+                                                 IN_PREPARATION: self.__parameters["base-preparation-time"].initialize("base-preparation-time"),
+                                                 IN_OPERATION:   self.__parameters["base-operation-time"].initialize("base-operation-time"),
+                                                 IN_RECOVERY:    self.__parameters["base-recovery-time"].initialize("base-recovery-time")
+                                              }, self.__patient_types)
+
+        if heap_engine:
+            self.__preparation_units = Units(self.__parameters["number-of-preparation-units"], self.__update_idle_capacity)
+            self.__operation_units =   Units(self.__parameters["number-of-operation-units"], self.__update_operation_usage)
+            self.__recovery_units =    Units(self.__parameters["number-of-recovery-units"], self.__update_recovery_busy)
+            pipeline = SurgeryPipeline(self.__environment, self.__preparation_units, self.__operation_units, self.__recovery_units, patient_generator)
+
+            # Add monitor and start simulation (with entry point at patient generator):
+            self.__environment.start(self.__sampler())
+            pipeline.start()
+        else:
+            # Created instances with provided parameters:
+            recovery =    RecoveryUnits(MonitoredResource(self.__environment, self.__parameters["number-of-recovery-units"], self.__update_recovery_busy))
+            operation =   OperationUnits(MonitoredResource(self.__environment, self.__parameters["number-of-operation-units"], self.__update_operation_usage), recovery)
+            preparation = PreparationUnits(MonitoredResource(self.__environment, self.__parameters["number-of-preparation-units"], self.__update_idle_capacity), operation)
+            self.__preparation_units, self.__operation_units, self.__recovery_units = preparation.resources, operation.resources, recovery.resources
+            self.__phases = (preparation, operation, recovery)
+
+            # Add monitor process:
+            self.__environment.process(self.__timeouts(self.__sampler()))
+
+            # Start simulation (with entry point at patient generator):
+            flat = self.__parameters["patient-lifecycle"] is PatientLifecycle.FLAT
+            self.__environment.process(patient_generator.run(self.__environment, preparation.run_lifecycle if flat else preparation.enter_phase))
+
+        while self.__simulation_time is None:
+            self.__environment.run(until=self.__environment.now + self.__parameters["warm-up-observation"])
+        self.__environment.run(until=self.__simulation_time)
+        self.__update_levels()
+        Statistics.end_sample()
+        self.__sample_start is not None and self.__sample_times.append(time.perf_counter() - self.__sample_start)
+        patient_records.close()
+        self.__trace is not None and self.__trace.close({"sample-warm-up": self.__warm_up, "simulation-time": self.__simulation_time})
+
+        samples = {name: stat.get_samples() for name, stat in self.__statistics.items()}
+        return self.__merge_batches(samples) if self.__batch_means and self.__merge else samples
+
+
+    def get_event_count(self):
+        """
+            Returns number of events processed by simulation engine of the completed run.
+        """
+        if isinstance(self.__environment, EventCalendar):
+            return self.__environment.processed
+        # SimPy numbers all scheduled events, events left in the queue were not processed:
+        return next(self.__environment._eid) - len(self.__environment._queue)
+
+
+    def __merge_batches(self, samples):
+        """
+            Merges contiguous base batches of <samples> into batches with (approximately) uncorrelated means.
+        """
+        size, correlation = get_batch_size(samples, self.__parameters["batch-max-correlation"])
+        count = len(next(iter(samples.values()))[0]) // size
+        Logger.log(LogLevel.INFO, "Batch means: {} batches of {} hours (largest lag-1 autocorrelation {:.2f}).", count, size * self.__sampling["sample-time"], correlation)
+        if correlation > max(self.__parameters["batch-max-correlation"], 1.96 / math.sqrt(count)):
+            Logger.log(LogLevel.WARNING, "Batch means are correlated (lag-1 autocorrelation {:.2f}), consider longer simulation.", correlation)
+        return {name: merge_batches(values, counts, size, self.__statistics[name].get_type() is Counter) for name, (values, counts) in samples.items()}
+
+
+    def __timeouts(self, generator):
+        """
+            Adapts <generator> yielding delays into SimPy process.
+        """
+        for delay in generator:
+            yield self.__environment.timeout(delay)
+
+
+    def __sampler(self):
+        """
+            Sampler method takes care of sampling with specific interval and length.
+            Yields delays between steps. Time-weighted statistics are updated only when 
+            the measured value changes, sampler only closes them at sample boundaries.
+        """
+
+        if self.__detector is None:
+            Logger.log(LogLevel.INFO, "Starting simulation warm-up period.")
+            yield self.__parameters["sample-warm-up"]
+        else:
+            yield from self.__detect_warm_up()
+        Logger.log(LogLevel.INFO, "Warm-up period ended, start taking samples.")
+
+        while True:
+            Statistics.start_sample()
+            self.__update_levels()
+            Logger.log(LogLevel.INFO, "Start taking new sample.")
+            self.__sample_start = time.perf_counter()
+
+            yield self.__sampling["sample-time"]
+
+            self.__update_levels()
+            Statistics.end_sample()
+            self.__sample_times.append(time.perf_counter() - self.__sample_start)
+            self.__sample_start = None
+            Logger.log(LogLevel.INFO, "Sample taken.")
+            self.__on_sample is not None and self.__on_sample(self.__run, len(self.__sample_times) - 1, {name: stat.get_value(-1) for name, stat in self.__statistics.items()})
+
+            # Next batch starts immediately:
+            if self.__batch_means:
+                continue
+
+            # Output statistics to stdout for current sample:
+            self.__verbose and print("{}\n{}\n{}".format("-" * 150, Statistics.get_as_string(self.__statistics.keys(), -1), "-" * 150))
+
+            # Wait until time to get next sample:
+            yield self.__sampling["sample-interval"]
+
+
+    def __detect_warm_up(self):
+        """
+            Observes arrival queue length and operation usage until MSER-5 detects end of the transient
+            or max-warm-up is reached. Yields observation windows. Sets warm-up and simulation time.
+        """
+        Logger.log(LogLevel.INFO, "Starting simulation warm-up period with MSER-5 warm-up detection.")
+        truncation = None
+        while truncation is None and self.__environment.now < self.__parameters["max-warm-up"]:
+            yield self.__detector.observation
+            self.__detector.observe(self.__environment.now)
+            truncation = self.__detector.get_truncation()
+
+        if truncation is None:
+            Logger.log(LogLevel.WARNING, "Warm-up not detected within max-warm-up ({} hours), starting samples.", self.__parameters["max-warm-up"])
+        else:
+            Logger.log(LogLevel.INFO, "Warm-up detected (MSER-5): truncation point at {:.0f} hours, sampling starts at {:.0f} hours.", truncation, self.__environment.now)
+        self.__detector = None
+        self.__warm_up = self.__environment.now
+        self.__simulation_time = self.__get_simulation_time()
+
+
+    def __get_simulation_time(self):
+        """
+            Returns total simulation time (warm-up + samples and intervals between them).
+        """
+        return self.__warm_up + self.__sampling["sample-count"] * (self.__sampling["sample-interval"] + self.__sampling["sample-time"]) - self.__sampling["sample-interval"]
+
+
+    def __update_levels(self):
+        """
+            Updates all time-weighted statistics with current values.
+        """
+        self.__update_operation_usage()
+        self.__update_idle_capacity()
+        self.__update_recovery_busy()
+        self.__update_arrival_queue(self.__environment.now)
+
+
+    def __update_arrival_queue(self, time_stamp):
+        self.__detector is not None and self.__detector.update("arrival-queue-length", self.__arrival_queue, time_stamp)
+        Statistics.update_sample("arrival-queue-length", self.__arrival_queue, time_stamp)
+
+
+    def __update_operation_usage(self):
+        self.__trace is not None and self.__trace.record_units(UNITS_OPERATION, self.__operation_units.count, self.__environment.now)
+        usage = self.__operation_units.count / self.__operation_units.capacity * 100.0
+        self.__detector is not None and self.__detector.update("usage_of_operation_unit", usage, self.__environment.now)
+        Statistics.update_sample("usage_of_operation_unit", usage, self.__environment.now)
+
+
+    def __update_idle_capacity(self):
+        self.__trace is not None and self.__trace.record_units(UNITS_PREPARATION, self.__preparation_units.count, self.__environment.now)
+        Statistics.update_sample("idle-capacity-preparation", self.__preparation_units.capacity - self.__preparation_units.count, self.__environment.now)
+
+
+    def __update_recovery_busy(self):
+        self.__trace is not None and self.__trace.record_units(UNITS_RECOVERY, self.__recovery_units.count, self.__environment.now)
+        Statistics.update_sample("all-recovery-units-busy", 100.0 if self.__recovery_units.capacity == self.__recovery_units.count else 0, self.__environment.now)
+
+
+    def __on_patient_status_traced(self, status, patient, time_stamp):
+        """
+            Records status change into event trace before collecting statistics.
+        """
+        self.__trace.record(status, patient, time_stamp)
+        self.on_patient_status_changed(status, patient, time_stamp)
+
+
+    def on_patient_status_changed(self, status, patient, time_stamp):
+        """
+            Callback to collect statistics when patient status is changed.
+        """
+
+        if status == WAITING:
+            self.__arrival_queue += 1
+            self.__update_arrival_queue(time_stamp)
+        elif status == IN_PREPARATION:
+            self.__arrival_queue -= 1
+            self.__update_arrival_queue(time_stamp)
+        elif status == PREPARED:
+            Statistics.update_sample("number_of_prepared")
+        elif status == OPERATED:
+            Statistics.update_sample("number_of_operated")
+            #StatisticsCollection.update_statistic("rate-blocking-operations", [time_stamp,  1 if self.__recovery_units.capacity == self.__recovery_units.count  else 0])
+            Statistics.update_sample("rate-blocking-operations", 100.0 if self.__recovery_units.capacity == self.__recovery_units.count  else 0)
+        elif status == RECOVERED:
+            Statistics.update_sample("mean_time_per_prepare", patient.time_stamps[PREPARED] - patient.time_stamps[WAITING])
+            Statistics.update_sample("mean_time_per_operate", patient.time_stamps[OPERATED] - patient.time_stamps[PREPARED])
+            Statistics.update_sample("mean_time_per_patient", patient.time_stamps[RECOVERED] - patient.time_stamps[WAITING])
+            Statistics.update_sample("number_of_recovered")
+        elif status == DECEASED:
+            Statistics.update_sample("number_of_deceased")
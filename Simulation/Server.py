@@ -0,0 +1,298 @@
+from Simulation.Simulation import Simulation
+from Simulation.Replication import Replication
+from Simulation.Context import SimulationContext
+from Simulation.Api import SimulationResult, get_configuration
+from Core.Exceptions import SimulationException
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import asyncio
+import json
+import math
+import os
+
+"""
+    Server module
+
+    Long-running job server, which keeps a pool of warm worker processes (interpreter started
+    and simulator imported), so that scenarios can be simulated without the start-up cost of
+    main.py. Clients connect to a Unix socket (or local TCP port) and submit jobs as JSON
+    lines, each job is a single scenario given as configuration file contents (string or list
+    of lines) and/or dictionary of parameters (parameters override the configuration):
+
+        {"configuration": "number-of-runs: 5\\n", "parameters": {"number-of-recovery-units": 5}}
+
+    Runs of all jobs are scheduled onto the worker pool, and server streams JSON lines back
+    to the client as soon as they are produced:
+
+        {"job": 0, "event": "accepted", "runs": 5}
+        {"job": 0, "event": "sample", "run": 0, "sample": 0, "values": {<statistic>: <value>, ...}}
+        {"job": 0, "event": "run", "run": 0, "counters": {...}}
+        {"job": 0, "event": "result", "runs": 5, "statistics": {<statistic>: {"mean": .., "confidence-interval": .., "samples": ..}}}
+        {"job": 0, "event": "error", "message": "..."}
+
+    Runs are added until target-precision is met, as in the command line simulation. Samples
+    are streamed from worker processes through a queue, values without samples are null.
+    Many clients and jobs can be in flight at once; jobs of a closed connection are cancelled.
+    Parameter sweeps are not supported, submit each scenario as its own job.
+
+"""
+
+_events = None  # Queue of events produced by the worker process.
+
+def _initialize_worker(events):
+    """
+        Stores <events> queue of the worker process.
+    """
+    global _events
+    _events = events
+
+
+def _warm_up():
+    """
+        Executed once in every worker process when the pool is started, so that workers are ready for jobs.
+    """
+    return os.getpid()
+
+
+def _run_job_replication(job, lines, run):
+    """
+        Executes run <run> of job <job> with configuration parsed from <lines> in its own context.
+        Completed samples and finally samples and counters of the run are put into events queue.
+        NOTE: executed in worker processes.
+    """
+    with SimulationContext():
+        parameters = Simulation._parse_parameters(lines)
+        replication = Replication(parameters, Simulation._get_patient_types(parameters), run, verbose=False,
+                                  on_sample=lambda run, sample, values: _events.put((job, "sample", run, sample, values)), scenario=job)
+        samples = replication.run()
+    _events.put((job, "run", run, samples, replication.counters))
+
+
+def _get_json_value(value):
+    """
+        Returns <value> as valid JSON value (NaN and infinite values are null).
+    """
+    return value if not isinstance(value, float) or math.isfinite(value) else None
+
+
+class Job:
+    """
+        Single scenario submitted by a client (<writer> is the stream of the client).
+    """
+
+    def __init__(self, index, lines, parameters, writer):
+        self.index = index
+        self.lines = lines
+        self.parameters = parameters
+        self.writer = writer
+        self.patient_types = Simulation._get_patient_types(parameters)
+        self.runs = Replication.get_run_count(parameters, parameters["number-of-runs"])
+        self.samples = {}       # Samples of completed runs by run index.
+        self.counters = {}      # Counters of completed runs by run index.
+        self.futures = []
+
+
+    def get_result(self):
+        """
+            Returns SimulationResult of completed runs.
+        """
+        runs = sorted(self.samples)
+        statistics = Replication.merge_runs(self.parameters, self.patient_types, [self.samples[r] for r in runs])
+        return SimulationResult(self.parameters, statistics, [self.samples[r] for r in runs], [self.counters[r] for r in runs])
+
+
+
+class JobServer:
+    """
+        Asyncio front end of the job server (see module description).
+    """
+
+    def __init__(self, workers=None):
+        """
+            Creates server with pool of <workers> worker processes (number of CPUs if not given).
+        """
+        self.__workers = workers or os.cpu_count()
+        self.__events = multiprocessing.Queue()
+        self.__executor = None
+        self.__jobs = {}
+        self.__next_job = 0
+        self.__context = SimulationContext()
+
+
+    async def serve(self, path=None, port=None):
+        """
+            Starts worker pool and serves clients on Unix socket <path> or local TCP <port> until cancelled.
+        """
+        if port is None and not hasattr(asyncio, "start_unix_server"):
+            raise SimulationException("Unix sockets are not supported on this platform, use TCP port instead.")
+        loop = asyncio.get_running_loop()
+        self.__executor = ProcessPoolExecutor(max_workers=self.__workers, initializer=_initialize_worker, initargs=(self.__events,))
+        try:
+            await asyncio.gather(*[loop.run_in_executor(self.__executor, _warm_up) for _ in range(self.__workers)])
+            streaming = asyncio.ensure_future(self.__read_events())
+            if port is None:
+                server = await asyncio.start_unix_server(self.__handle_client, path)
+            else:
+                server = await asyncio.start_server(self.__handle_client, "127.0.0.1", port)
+            print("Job server listening on {} with {} worker processes.".format(path if port is None else "127.0.0.1:{}".format(port), self.__workers))
+            async with server:
+                await server.serve_forever()
+        finally:
+            [self.__cancel(job) for job in list(self.__jobs.values())]
+            self.__events.put(None)
+            self.__executor.shutdown(wait=True)
+            if port is None and os.path.exists(path):
+                os.remove(path)
+
+
+    async def __handle_client(self, reader, writer):
+        """
+            Reads job submissions of single client until the connection is closed.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    self.__submit(line, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            [self.__cancel(job) for job in list(self.__jobs.values()) if job.writer is writer]
+            writer.close()
+
+
+    def __submit(self, line, writer):
+        """
+            Parses job from request <line> of client <writer> and schedules its runs.
+        """
+        index = self.__next_job
+        self.__next_job += 1
+        try:
+            request = json.loads(line)
+            request = request if isinstance(request, dict) else {"configuration": None}
+            configuration, parameters = request.get("configuration", ""), request.get("parameters", {})
+            if isinstance(configuration, list) and all(isinstance(l, str) for l in configuration):
+                configuration = "\n".join(configuration)
+            if not isinstance(configuration, str) or not isinstance(parameters, dict):
+                raise SimulationException("Job must be JSON object with configuration (string or list of strings) and parameters (object).")
+            lines = (configuration + "\n").splitlines(keepends=True) + get_configuration(parameters)
+            with self.__context:
+                parameters = Simulation._parse_parameters(lines)
+                if len(parameters["sweep"]) != 0:
+                    raise SimulationException("Parameter sweep is not supported by job server, submit each scenario as its own job.")
+                job = Job(index, lines, parameters, writer)
+                parameters["target-precision"].validate(Replication.create_statistics(job.patient_types).keys())
+        except (ValueError, AttributeError, TypeError, KeyError, SimulationException) as e:
+            JobServer.__send(writer, {"job": index, "event": "error", "message": str(e)})
+            return
+        self.__jobs[index] = job
+        JobServer.__send(writer, {"job": index, "event": "accepted", "runs": job.runs})
+        self.__schedule(job, range(job.runs))
+
+
+    def __schedule(self, job, runs):
+        """
+            Submits <runs> of <job> into worker pool.
+        """
+        loop = asyncio.get_running_loop()
+        for run in runs:
+            future = loop.run_in_executor(self.__executor, _run_job_replication, job.index, job.lines, run)
+            future.add_done_callback(lambda future, job=job: self.__on_run_done(job, future))
+            job.futures.append(future)
+
+
+    def __on_run_done(self, job, future):
+        """
+            Reports failed run of <job>, whole job is cancelled. Results of successful runs arrive through events queue.
+        """
+        if future.cancelled() or future.exception() is None or job.index not in self.__jobs:
+            return
+        JobServer.__send(job.writer, {"job": job.index, "event": "error", "message": "Run failed: {}".format(future.exception())})
+        self.__cancel(job)
+
+
+    def __cancel(self, job):
+        """
+            Cancels runs of <job> that are not yet started and forgets the job.
+        """
+        [future.cancel() for future in job.futures]
+        self.__jobs.pop(job.index, None)
+
+
+    async def __read_events(self):
+        """
+            Streams events of worker processes to clients until None is received.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await loop.run_in_executor(None, self.__events.get)
+            if event is None:
+                return
+            index, kind, run, *data = event
+            job = self.__jobs.get(index)
+            if job is None:
+                continue
+            if kind == "sample":
+                sample, values = data
+                JobServer.__send(job.writer, {"job": index, "event": "sample", "run": run, "sample": sample, "values": {k: _get_json_value(v) for k, v in values.items()}})
+            else:
+                job.samples[run], job.counters[run] = data
+                JobServer.__send(job.writer, {"job": index, "event": "run", "run": run, "counters": job.counters[run]})
+                self.__on_run_completed(job)
+
+
+    def __on_run_completed(self, job):
+        """
+            Adds runs to <job> until target precision is met, then sends result of the job.
+        """
+        if len(job.samples) != job.runs:
+            return
+        result = job.get_result()
+        runs = min(Replication.get_run_count(job.parameters, job.parameters["target-precision"].get_run_count(result.statistics, job.runs, job.parameters["max-number-of-runs"])), job.parameters["max-number-of-runs"])
+        if runs != job.runs:
+            self.__schedule(job, range(job.runs, runs))
+            job.runs = runs
+            return
+        statistics = {}
+        for name, stat in result.statistics.items():
+            try:
+                statistics[name] = {"mean": _get_json_value(stat.get_mean()), "confidence-interval": _get_json_value(stat.get_confidence_interval()), "samples": len(stat)}
+            except (ZeroDivisionError, ValueError):
+                statistics[name] = {"mean": None, "confidence-interval": None, "samples": len(stat)}
+        JobServer.__send(job.writer, {"job": job.index, "event": "result", "runs": job.runs, "statistics": statistics})
+        del self.__jobs[job.index]
+
+
+    @staticmethod
+    def __send(writer, message):
+        """
+            Writes <message> as JSON line to client <writer> (ignored if the connection is closed).
+        """
+        if not writer.is_closing():
+            writer.write((json.dumps(message) + "\n").encode())
+
+
+
+async def submit(configuration="", parameters=None, path=None, port=None):
+    """
+        Submits single job (<configuration> file contents and/or <parameters> dictionary) to job server at
+        Unix socket <path> or local TCP <port>. Yields messages of the job until its result or error.
+    """
+    if port is None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write((json.dumps({"configuration": configuration, "parameters": parameters or {}}) + "\n").encode())
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise SimulationException("Connection to job server was closed.")
+            message = json.loads(line)
+            yield message
+            if message["event"] in ("result", "error"):
+                return
+    finally:
+        writer.close()
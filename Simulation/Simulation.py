@@ -1,15 +1,29 @@
 from Core.Parameters.Parameters import SimulationParameter, SimulationParameters, ParameterValidation as PV
-from Simulation.Patients import PatientGenerator, PatientRecords, PatientStatus, PatientCondition
-from Simulation.Phases import RecoveryUnits, OperationUnits, PreparationUnits
-from Core.Logging.Logging import SimLogger as Logger, LogLevel
-from Core.Distributions import RandomGenerator as Random
-from Core.Distributions import Distribution, Rng
+from Simulation.Patients import PatientCondition, RecordRetention
+from Simulation.Replication import Replication, SimulationEngine
+from Simulation.Phases import PatientLifecycle
+from Simulation.Sweep import SweepGrid
+from Simulation.Estimator import QueueEstimate, EstimateFilter
+from Simulation.Optimizer import UnitOptimizer, OptimizationConstraints, UnitRanges, Candidate, CandidateStatus
+from Simulation.Trace import EventTrace
+from Simulation.Manifest import JobManifest
+from Simulation.Cache import ResultCache, CacheMode
+from Core.Logging.Logging import SimLogger as Logger, LogLevel, LogWriter
+from Core.Distributions import Distribution, Rng, RandomBackend, VarianceReduction
 from Core.Statistics.Statistics import *
+from Core.Exceptions import SimulationException
+from Core.Profiling import ProfileMode
+from Core.Statistics.Sinks import ResultsSink, SinkFormat
+from Core.Statistics.Analysis import WarmUpDetection, SamplingMode, SampleAnalysis, get_sample_correlations, get_sample_spacing, get_sample_length, get_observed_size, merge_batches
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from enum import IntEnum
+from enum import IntEnum, Enum
 import argparse
+import hashlib
+import itertools
 import simpy
 import sys
+import os
 
 """
 
@@ -35,43 +49,65 @@ class Simulation():
     __supported_parameters = {
             "log-level":                   SimulationParameter("Log level: DEBUG, INFO, WARNING, ERROR or CRITICAL.", "INFO", PV.validate_enum, LogLevel),
             "log-out":                     SimulationParameter("Log output: LOG_NONE, LOG_TO_STDOUT, LOG_TO_FILE or LOG_BOTH. LOG_BOTH will output log into stdout and file both.", "LOG_BOTH", PV.validate_enum, LogOutput),
+            "log-writer":                  SimulationParameter("Log writer: SYNCHRONOUS or ASYNCHRONOUS (records are written in batches by background thread).", "SYNCHRONOUS", PV.validate_enum, LogWriter),
             "sample-warm-up":              SimulationParameter("Time in hours before first sample is taken.", 1000, PV.validate_integer, 0),
+            "sampling":                    SimulationParameter("Sampling: INTERVALS (samples of sample-time hours separated by sample-interval hours) or BATCH_MEANS\n(sample-count x sample-time hours after warm-up are sampled into contiguous batches, batch size is chosen automatically).", "INTERVALS", PV.validate_enum, SamplingMode),
+            "batch-base-time":             SimulationParameter("Length of base batch in hours with BATCH_MEANS sampling, batches are multiples of base batch.", 50, PV.validate_integer, 1),
+            "batch-max-correlation":       SimulationParameter("Largest accepted lag-1 autocorrelation of batch means with BATCH_MEANS sampling.", 0.1, PV.validate_float, 0.0, 1.0),
+            "sample-analysis":             SimulationParameter("Sample analysis: NONE, RECOMMEND (pilot run estimates autocorrelation of each statistic and logs the smallest\nsample-interval and sample-time giving effectively independent samples) or APPLY (as RECOMMEND, but sample-time and\nsample-interval are applied).", "NONE", PV.validate_enum, SampleAnalysis),
+            "pilot-time":                  SimulationParameter("Length of pilot run of sample analysis in hours after warm-up (sampled into base batches of batch-base-time hours).", 50000, PV.validate_integer, 1),
+            "sample-max-correlation":      SimulationParameter("Largest accepted correlation of consecutive samples with sample analysis.", 0.1, PV.validate_float, 0.0, 1.0),
+            "warm-up-detection":           SimulationParameter("Warm-up: FIXED (sample-warm-up hours) or MSER5 (detected from arrival queue length and operation usage,\nsampling starts once the transient is over).", "FIXED", PV.validate_enum, WarmUpDetection),
+            "warm-up-observation":         SimulationParameter("Length of single observation in hours used by warm-up detection (MSER5 averages batches of 5 observations).", 5, PV.validate_integer, 1),
+            "max-warm-up":                 SimulationParameter("Maximum warm-up in hours with warm-up detection.", 20000, PV.validate_integer, 0),
             "sample-interval":             SimulationParameter("Timeout in hours between single samples.", 1000, PV.validate_integer, 0),
             "sample-time":                 SimulationParameter("Length of single sample in hours.", 1000, PV.validate_integer, 0),
             "sample-count":                SimulationParameter("Number of samples int total.", 20, PV.validate_integer, 0),
-            "random-seed":                 SimulationParameter("Start seed for random number generator.", 1, PV.validate_integer, 0),
+            "random-seed":                 SimulationParameter("Seed for random number generator. Seed of each random stream is derived from this seed, index of the run and name of the stream.", 1, PV.validate_integer, 0),
             "result-folder":               SimulationParameter("Folder to store simulation results.", "./", PV.validate_folder),
             "number-of-preparation-units": SimulationParameter("Number of preparation units [1 - 100].", 10, PV.validate_integer, 1, 100),
             "number-of-operation-units":   SimulationParameter("Number of operation units [1 - 100].", 4, PV.validate_integer, 1, 100),
             "number-of-recovery-units":    SimulationParameter("Number of operation units [1 - 100].", 10, PV.validate_integer, 1, 100),
             "patient-interval":            SimulationParameter("Patient arrival rate in hours. Format: [\"EXPONENTIAL\", <mean>] or [\"UNIFORM\", <min>, <max>].", ["EXPONENTIAL", 25.0], PV.validate_object, Rng),
-            "number-of-runs":              SimulationParameter("Number of simulations runs with different random seed, starting from <random-seed> and inceased by one between runs.", 1, PV.validate_integer, 0),
+            "random-backend":              SimulationParameter("Random number generator: PYTHON (random module) or NUMPY (variates drawn in blocks from NumPy generator, requires NumPy).", "PYTHON", PV.validate_enum, RandomBackend),
+            "variance-reduction":          SimulationParameter("Variance reduction: NONE, COMMON_RANDOM_NUMBERS (dedicated random substream for each patient, so that scenarios see the same patients)\nor ANTITHETIC (as COMMON_RANDOM_NUMBERS, but every second run uses antithetic variates of the previous run).", "NONE", PV.validate_enum, VarianceReduction),
+            "number-of-runs":              SimulationParameter("Number of simulations runs. Each run has its own independent random streams derived from <random-seed> and index of the run.", 1, PV.validate_integer, 0),
+            "target-precision":            SimulationParameter("Target half-widths of 95% confidence intervals. Dictionary of statistic names and [\"ABSOLUTE\", <half-width>] or\n[\"RELATIVE\", <fraction of mean>], e.g. {\"usage_of_operation_unit\": [\"ABSOLUTE\", 1.0]}. Runs are added until all targets are met.", PrecisionTargets("{}"), PV.validate_object, PrecisionTargets),
+            "max-number-of-runs":          SimulationParameter("Maximum number of runs when target-precision is given.", 100, PV.validate_integer, 1),
+            "number-of-workers":           SimulationParameter("Number of worker processes to execute simulation runs in parallel, 0 to use all available cores.", 1, PV.validate_integer, 0),
             "base-preparation-time":       SimulationParameter("Base time (no additional multipliers) in hours that preparation takes. Format: [\"EXPONENTIAL\", <mean>] or [\"UNIFORM\", <min>, <max>].", ["EXPONENTIAL", 20.0], PV.validate_object, Rng),
             "base-operation-time":         SimulationParameter("Base time (no additional multipliers) in hours that operation takes. Format: [\"EXPONENTIAL\", <mean>] or [\"UNIFORM\", <min>, <max>]. ", ["EXPONENTIAL", 40.0], PV.validate_object, Rng),
             "base-recovery-time":          SimulationParameter("Base time (no additional multipliers) in hours that recovery takes. Format: [\"EXPONENTIAL\", <mean>] or [\"UNIFORM\", <min>, <max>].", ["EXPONENTIAL", 40.0], PV.validate_object, Rng),
             "patient-condition-*":         SimulationParameter("Different condition for patients. Array of:\n -priority (lower priorities are more urgent),\n -generator portion (0 => 0%, 1.0 => 100%),\n -mean death rate per 100 hours elapsed before OPERATED (0 => 0%, 1.0 => 100%)\n -array of 3 different service time multipliers (preparation, operation, recovery).\n", 
                                                                PatientCondition("[1, 1.0, 0.0, [1.0, 1.0, 1.0]]"), PV.validate_object, PatientCondition),
+            "simulation-engine":           SimulationParameter("Simulation engine: SIMPY (SimPy processes) or HEAP (binary-heap event calendar, faster).", "SIMPY", PV.validate_enum, SimulationEngine),
+            "patient-lifecycle":           SimulationParameter("Patient processes with SIMPY engine: NESTED (process per phase) or FLAT (single process per patient).", "NESTED", PV.validate_enum, PatientLifecycle),
+            "patient-records":             SimulationParameter("Retention of records of exited patients: DROP_ON_EXIT, KEEP_LAST (keep last <patient-records-kept> records)\nor SPILL_TO_DISK (write records into patients_<scenario>_<run>.csv in result folder).", "DROP_ON_EXIT", PV.validate_enum, RecordRetention),
+            "patient-records-kept":        SimulationParameter("Number of exited patient records kept in memory with KEEP_LAST retention.", 1000, PV.validate_integer, 0),
+            "event-trace":                 SimulationParameter("Event trace: NONE or BINARY (patient status transitions are written into trace_<scenario>_<run>.bin in result folder,\nstatistics can be recomputed from traces with replay.py).", "NONE", PV.validate_enum, EventTrace),
+            "optimization-constraints":    SimulationParameter("Constraints of unit optimization. Dictionary of statistic names and [<min>, <max>], e.g. {\"rate-blocking-operations\": [0, 2]}.\nIf given, the cheapest unit configuration meeting the constraints is searched instead of simulating the configuration.", OptimizationConstraints("{}"), PV.validate_object, OptimizationConstraints),
+            "optimization-units":          SimulationParameter("Ranges of unit counts searched by unit optimization. Dictionary of unit parameter names and [<min>, <max>].", 
+                                                               UnitRanges('{"number-of-preparation-units": [1, 10], "number-of-operation-units": [1, 4], "number-of-recovery-units": [1, 10]}'), PV.validate_object, UnitRanges),
+            "optimization-budget":         SimulationParameter("Maximum total number of simulation runs of unit optimization.", 500, PV.validate_integer, 1),
+            "optimization-increment":      SimulationParameter("Number of simulation runs allocated among undecided candidates in each round of unit optimization.", 10, PV.validate_integer, 1),
+            "profile":                     SimulationParameter("Profiling of each run: NONE, CPU (cProfile), MEMORY (tracemalloc) or FULL (both). Reports are written into\nprofile_<scenario>_<run>.txt and profile_<scenario>_<run>.prof in result folder.", "NONE", PV.validate_enum, ProfileMode),
+            "result-cache":                SimulationParameter("Result cache: NONE, READ_WRITE (samples of runs are stored into result-cache-folder and runs found in the cache are not\nsimulated again) or REFRESH (runs are simulated and stored, cached samples are replaced).", "NONE", PV.validate_enum, CacheMode),
+            "result-cache-folder":         SimulationParameter("Folder of the result cache (can be shared by simulations with different result folders).", Path("result-cache"), PV.validate_folder),
+            "result-cache-size":           SimulationParameter("Maximum size of the result cache in megabytes, least recently used runs are evicted.", 1000, PV.validate_integer, 1),
+            "results-sink":                SimulationParameter("Format of samples written after each completed run: NONE, CSV (samples.csv), NPZ or PARQUET\n(part file per run in samples folder). statistics.csv is written after all runs in any case.", "NONE", PV.validate_enum, SinkFormat),
+            "sweep":                       SimulationParameter("Parameter sweep. Dictionary of parameter names and lists of values, e.g. {\"number-of-recovery-units\": [4, 5]}.\nEvery combination of values is simulated as its own scenario.", SweepGrid("{}"), PV.validate_object, SweepGrid),
+            "sweep-filter":                SimulationParameter("Bounds of analytically estimated statistics of sweep scenarios. Dictionary of statistic names and [<min>, <max>],\ne.g. {\"usage_of_operation_unit\": [0, 95]}. Only feasible scenarios within bounds are simulated (estimates in sweep_estimates.csv).", EstimateFilter("{}"), PV.validate_object, EstimateFilter),
         }
 
-    __statistics = {
-            "number_of_prepared":         SampleCollection(desc_l="Number of patients PREPARED in total",         desc_s="total_prepared",       type=Counter),
-            "number_of_operated":         SampleCollection(desc_l="Number of patients OPERATED in total",         desc_s="total_operated",       type=Counter),
-            "number_of_recovered":        SampleCollection(desc_l="Number of patients RECOVERED in total",        desc_s="total_recoved",        type=Counter),
-            "number_of_deceased":         SampleCollection(desc_l="Number of patients DECEASED in total",         desc_s="total_deceased",       type=Counter),
-            "total-number-of-patients":   SampleCollection(desc_l="Total number of patients generated.",          desc_s="total_patients",       type=Counter),
-            "patient-generator-interval": SampleCollection(desc_l="True interval of generating patients",         desc_s="interval_patients",    unit="hours"),
-            "mean_time_per_prepare":      SampleCollection(desc_l="Mean time spent from WAITING to PREPARED",     desc_s="from_wait_to_prep",    unit="hours"),
-            "mean_time_per_operate":      SampleCollection(desc_l="Mean time spent from PREPARED to OPERATED",    desc_s="from_prep_to_oper",    unit="hours"),
-            "mean_time_per_patient":      SampleCollection(desc_l="Mean time spent from WAITING to RECOVERED",    desc_s="from_wait_to_reco",    unit="hours"),
-            "mean-in-preparation-time":   SampleCollection(desc_l="Mean preparation time based on distribution.", desc_s="mean_prep_time_distr", unit="hours"),
-            "mean-in-operation-time":     SampleCollection(desc_l="Mean operation time based on distribution.",   desc_s="mean_oper_time_distr", unit="hours"),
-            "mean-in-recovery-time":      SampleCollection(desc_l="Mean recovery time based on distribution.",    desc_s="mean_oper_reco_distr", unit="hours"),
-            "usage_of_operation_unit":    SampleCollection(desc_l="Utilization of the operation theater",         desc_s="operation_usage",      unit="%"),
-            "arrival-queue-length":       SampleCollection(desc_l="Patients at the arrival queue",                desc_s="arr_queue_length"),
-            "idle-capacity-preparation":  SampleCollection(desc_l="Idle capacity at prepration",                  desc_s="idle_capacity"),
-            "rate-blocking-operations":   SampleCollection(desc_l="Moving to recovery blocked",                   desc_s="move_reco_blocked",    unit="%"),
-            "all-recovery-units-busy":    SampleCollection(desc_l="All recovery units are busy",                  desc_s="all_reco_busy",        unit="%"),
-        }
+    # Index of pilot run (random streams of pilot run are independent of streams of simulation runs):
+    PILOT_RUN = -1
+
+    # Parameters that do not affect samples of a single run:
+    __execution_parameters = {"log-level", "log-out", "log-writer", "result-folder", "number-of-runs", "number-of-workers", "max-number-of-runs", 
+                              "target-precision", "sweep", "sweep-filter", "results-sink", "optimization-constraints",
+                              "optimization-units", "optimization-budget", "optimization-increment", "patient-records", "patient-records-kept", "event-trace", "profile",
+                              "result-cache", "result-cache-folder", "result-cache-size",
+                              "sample-analysis", "pilot-time", "sample-max-correlation"}
 
     def __init__(self):
 
@@ -87,75 +123,56 @@ class Simulation():
             return
 
         # Parse parameters for the simulation:
-        self.__parameters = SimulationParameters(command_line_args.conf.readlines(), self.__supported_parameters)
+        lines = command_line_args.conf.readlines()
+        self.__parameters = SimulationParameters(lines, self.__supported_parameters)
         # TODO: close file in case of exception
         command_line_args.conf.close()
 
-        
-        # Remove default value from patient-types if user provided types exists, otherwise name * to DEFAULT:
-        self.__patient_types = self.__parameters["patient-condition-*"]
-        if len(self.__patient_types) > 1:
-            del self.__patient_types["*"]
-        else:
-            self.__patient_types["DEFAULT"] = self.__patient_types.pop("*")
-            
         self.__environment = simpy.Environment()
         
         # Initialize logger with requested log level and log all used parameters:
-        Logger(self.__parameters["log-level"], self.__environment, stdout=self.__parameters["log-out"] & 10, file = self.__parameters["result-folder"] / "log.log" if self.__parameters["log-out"] & 12 else None)
+        Simulation._initialize_logger(self.__parameters, self.__environment)
         Logger.log(LogLevel.INFO, "Prepared simulation with configuration from file: " + str(sys.argv[-1]) + ".")
         Logger.log(LogLevel.INFO, "Starting simulation with following parameters:\n" +  "\n".join(["{:30} {}".format(p, self.__parameters[p]) for p in self.__supported_parameters]))
-        
-
-        # Initialize statistics:
-        self.__statistics = { **{ "patient-portion-" + k: SampleCollection(desc_l="True portion of {} patients".format(k), desc_s="portion_{}".format(k), unit="%") for k in self.__patient_types.keys()},  **self.__statistics }
-        Statistics()
-        [Statistics.add_statistic(name, stat) for name, stat in self.__statistics.items()]
 
         Logger.log(LogLevel.INFO, "Starting simulation.")
-        
-        for r in range(0, self.__parameters["number-of-runs"]):
-            
-            print("-" * 150)
-            Logger.log(LogLevel.INFO, "Starting simulation run {}.".format(r))
-        
-            # Initialize RNG:
-            Random(self.__parameters["random-seed"] + r)
-            
-            # Created instances with provided parameters:
-            self.__recovery =    RecoveryUnits(simpy.PriorityResource(self.__environment, capacity=self.__parameters["number-of-recovery-units"]))
-            self.__operation =   OperationUnits(simpy.PriorityResource(self.__environment, capacity=self.__parameters["number-of-operation-units"]), self.__recovery)
-            self.__preparation = PreparationUnits(simpy.PriorityResource(self.__environment, capacity=self.__parameters["number-of-preparation-units"]), self.__operation)
-
-            # Create records:
-            patient_records = PatientRecords(self.on_patient_status_changed)
-
-            # List to count patients at arrival queue:
-            self.__arrival_queue = []
-        
-            # Create patient generator:
-            patient_generator = PatientGenerator(self.__parameters["patient-interval"].initialize(), patient_records, {
-                                                     PatientStatus.IN_PREPARATION: self.__parameters["base-preparation-time"].initialize(),
-                                                     PatientStatus.IN_OPERATION:   self.__parameters["base-operation-time"].initialize(),
-                                                     PatientStatus.IN_RECOVERY:    self.__parameters["base-recovery-time"].initialize()
-                                                  }, self.__patient_types)
-                                              
-            # Add monitor process:
-            self.__environment.process(self.__sampler())
-
-            # Start simulation (with entry point at patient generator):
-            self.__environment.process(patient_generator.run(self.__environment, self.__preparation.enter_phase))
-
-            # Calculate total simulation time:
-            simulation_time = self.__parameters["sample-warm-up"] + self.__parameters["sample-count"] * (self.__parameters["sample-interval"] + self.__parameters["sample-time"]) - self.__parameters["sample-interval"]
 
-            self.__environment.run(until=simulation_time)
-
-            # Rest environment:
-            self.__environment = simpy.Environment()
+        # Expand parameter sweep into scenarios (single scenario if no sweep is given):
+        scenarios = self.__parameters["sweep"].get_scenarios(lines)
+        if len(self.__parameters["sweep"]) != 0:
+            scenarios = self.__filter_scenarios(scenarios)
+        else:
+            Logger.log(LogLevel.INFO, "Queueing estimate: {}.", QueueEstimate(self.__parameters, Simulation._get_patient_types(self.__parameters)))
+        self.__manifest = JobManifest(self.__parameters["result-folder"] / "manifest.jsonl", command_line_args.resume)
+        self.__sink = ResultsSink.create(self.__parameters["results-sink"], self.__parameters["result-folder"])
+        self.__cache = ResultCache(self.__parameters["result-cache"], self.__parameters["result-cache-folder"], self.__parameters["result-cache-size"] * 1024 ** 2)
+        if self.__cache.mode is CacheMode.READ_WRITE and (self.__parameters["event-trace"] is not EventTrace.NONE or self.__parameters["profile"] is not ProfileMode.NONE
+                                                          or self.__parameters["patient-records"] is RecordRetention.SPILL_TO_DISK):
+            Logger.log(LogLevel.WARNING, "Result cache is not read, because event traces, profiles or patient records are requested from every run.")
+            self.__cache.mode = CacheMode.REFRESH
+        try:
+            if len(self.__parameters["optimization-constraints"]) != 0:
+                statistics = [self.__optimize(lines)]
+            else:
+                statistics = self.__execute_scenarios([scenario_lines for _, scenario_lines in scenarios])
+        finally:
+            self.__sink.close()
+            self.__manifest.close()
+
+        if self.__cache.hits != 0:
+            Logger.log(LogLevel.INFO, "Samples of {} simulation runs were found in result cache.", self.__cache.hits)
+        Logger.log(LogLevel.INFO, "Simulation ended successfully.")
 
+        if len(self.__parameters["sweep"]) != 0:
+            with (self.__parameters["result-folder"] / "sweep_statistics.csv").open('w') as file:
+                file.write(SweepGrid.get_as_csv([values for values, _ in scenarios], statistics) + "\n")
+            Logger.log(LogLevel.INFO, "Statistics of {} scenarios written to {}.", len(scenarios), self.__parameters["result-folder"] / "sweep_statistics.csv")
+            return
 
-        Logger.log(LogLevel.INFO, "Simulation ended successfully.")
+        self.__statistics = statistics[0]
+        Statistics()
+        Statistics.clear()
+        [Statistics.add_statistic(name, stat) for name, stat in self.__statistics.items()]
         
         # Output last five statistics to stdout:
         print("{}\n{}\n{}".format("-" * 150, Statistics.get_as_string(list(self.__statistics.keys())[-5:]), "-" * 150))
@@ -164,38 +181,307 @@ class Simulation():
             file.write(Statistics.get_as_csv(self.__statistics.keys()) + "\n")
 
 
+    def __filter_scenarios(self, scenarios):
+        """
+            Estimates statistics of sweep <scenarios> analytically and writes estimates into sweep_estimates.csv.
+            Returns scenarios accepted by sweep-filter (all scenarios if no filter is given).
+        """
+        parameters = [SimulationParameters(lines, self.__supported_parameters) for _, lines in scenarios]
+        estimates = [QueueEstimate(p, Simulation._get_patient_types(p)) for p in parameters]
+        accepted = [len(self.__parameters["sweep-filter"]) == 0 or self.__parameters["sweep-filter"].accepts(e) for e in estimates]
+
+        with (self.__parameters["result-folder"] / "sweep_estimates.csv").open('w') as file:
+            file.write(QueueEstimate.get_as_csv([values for values, _ in scenarios], estimates, accepted) + "\n")
+        if not all(accepted):
+            Logger.log(LogLevel.INFO, "Sweep filter: {} of {} scenarios are simulated.", sum(accepted), len(scenarios))
+        return [scenario for scenario, selected in zip(scenarios, accepted) if selected]
+
 
-    def __sampler(self):
+    def __optimize(self, lines):
         """
-            Sampler method takes care of sampling with specific interval and length.
-            Also writes statistics with resolution to 1 time unit.
+            Searches the cheapest unit configuration meeting optimization constraints (see Optimizer module).
+            Candidate configurations are scenarios of base configuration <lines>. Optimization result is written
+            into optimization.csv. Returns statistics of the optimal configuration.
         """
+        if len(self.__parameters["sweep"]) != 0:
+            raise SimulationException("Unit optimization can't be combined with parameter sweep.")
+        constraints = self.__parameters["optimization-constraints"]
+        constraints.validate(Replication.create_statistics(Simulation._get_patient_types(self.__parameters)).keys())
+
+        # Candidates (analytically infeasible candidates are simulated last within their cost level):
+        scenarios = self.__parameters["optimization-units"].get_grid().get_scenarios(lines)
+        parameters = [SimulationParameters(scenario_lines, self.__supported_parameters) for _, scenario_lines in scenarios]
+        self.__scenario_keys = [Simulation._get_scenario_key(p) for p in parameters]
+        candidates = [Candidate(i, values, [p[name] for name in UnitRanges.NAMES]) for i, ((values, _), p) in enumerate(zip(scenarios, parameters))]
+        for candidate, p in zip(candidates, parameters):
+            if not QueueEstimate(p, Simulation._get_patient_types(p)).feasible:
+                candidate.status = CandidateStatus.ESTIMATED
+        optimizer = UnitOptimizer(constraints, sorted(candidates, key=lambda c: c.cost))
+        Logger.log(LogLevel.INFO, "Unit optimization: {} candidates, {} estimated to be infeasible (deferred within their cost level).", len(candidates), sum(c.status is CandidateStatus.ESTIMATED for c in candidates))
+
+        samples = [[] for _ in scenarios]
+        budget = self.__parameters["optimization-budget"]
+        initial = Replication.get_run_count(self.__parameters, max(2, self.__parameters["number-of-runs"]))
+        while budget > 0:
+            level = optimizer.get_level()
+            if len(level) == 0 or optimizer.get_optimum() is not None:
+                break
+
+            # Initial runs for new candidates of the level (within remaining budget), then allocate runs to undecided candidates:
+            allocation, remaining = {}, budget
+            for c in [c for c in level if c.runs < initial]:
+                allocation[c] = min(initial - c.runs, remaining)
+                remaining -= allocation[c]
+            if len(allocation) == 0:
+                allocation = optimizer.allocate(level, min(budget, self.__parameters["optimization-increment"]))
+            allocation = {c: min(Replication.get_run_count(self.__parameters, c.runs + runs) - c.runs, self.__parameters["max-number-of-runs"] - c.runs) for c, runs in allocation.items()}
+            allocation = {c: runs for c, runs in allocation.items() if runs > 0}
+            if len(allocation) == 0:
+                Logger.log(LogLevel.WARNING, "Unit optimization: max-number-of-runs ({}) exhausted before candidates of cost {} were classified.", self.__parameters["max-number-of-runs"], level[0].cost)
+                break
+
+            tasks = [(c.index, scenarios[c.index][1], range(c.runs, c.runs + runs)) for c, runs in allocation.items()]
+            for (c, runs), task_samples in zip(allocation.items(), self.__execute_runs(tasks)):
+                samples[c.index].extend(task_samples)
+                optimizer.update(c, self.__merge_samples(parameters[c.index], samples[c.index]), len(samples[c.index]))
+                budget -= runs
+            Logger.log(LogLevel.INFO, "Unit optimization: cost {}, {}.", level[0].cost, ", ".join("{} {} ({} runs)".format(c.units, c.status.name, c.runs) for c in level))
+
+        with (self.__parameters["result-folder"] / "optimization.csv").open('w') as file:
+            file.write(optimizer.get_as_csv() + "\n")
+
+        optimum = optimizer.get_optimum()
+        if optimum is None:
+            raise SimulationException("Unit optimization: no configuration meeting the constraints was found{}.".format(" (budget exhausted)" if budget <= 0 else ""))
+        Logger.log(LogLevel.INFO, "Unit optimization: cheapest configuration meeting the constraints is {} ({} units, {} runs).",
+                   ", ".join("{}: {}".format(name, units) for name, units in zip(UnitRanges.NAMES, optimum.units)), optimum.cost, optimum.runs)
+        return optimum.statistics
+
+
+    def __execute_scenarios(self, scenarios):
+        """
+            Executes runs of all <scenarios> (configuration lines of each scenario). If target precision
+            is given, runs are added until confidence intervals of targeted statistics are narrow enough
+            or max-number-of-runs is reached. Returns merged statistics of each scenario.
+        """
+        scenarios = [self.__analyze_samples(lines) for lines in scenarios]
+        parameters = [SimulationParameters(lines, self.__supported_parameters) for lines in scenarios]
+        self.__scenario_keys = [Simulation._get_scenario_key(p) for p in parameters]
+        [p["target-precision"].validate(Replication.create_statistics(Simulation._get_patient_types(p)).keys()) for p in parameters]
 
-        Logger.log(LogLevel.INFO, "Starting simulation warm-up period.")
-        yield self.__environment.timeout(self.__parameters["sample-warm-up"])
-        Logger.log(LogLevel.INFO, "Warm-up period ended, start taking samples.")
+        samples = self.__execute_runs([(i, lines, range(0, Replication.get_run_count(p, p["number-of-runs"]))) for i, (lines, p) in enumerate(zip(scenarios, parameters))])
 
         while True:
-            Statistics.start_sample()
-            Logger.log(LogLevel.INFO, "Start taking new sample.")
+            statistics = [self.__merge_samples(p, scenario_samples) for p, scenario_samples in zip(parameters, samples)]
 
-            for t in range(self.__parameters["sample-time"]):
-                yield self.__environment.timeout(1)
-                Statistics.update_sample("usage_of_operation_unit",   self.__operation.resources.count / self.__operation.resources.capacity * 100.0)
-                Statistics.update_sample("arrival-queue-length",      len(self.__arrival_queue))
-                Statistics.update_sample("idle-capacity-preparation", self.__preparation.resources.capacity - self.__preparation.resources.count)
-                Statistics.update_sample("all-recovery-units-busy",   100.0 if self.__recovery.resources.capacity == self.__recovery.resources.count else 0)
-            
-            Statistics.end_sample()
-            Logger.log(LogLevel.INFO, "Sample taken.")
+            # Estimate number of additional runs needed to reach target precision:
+            pending = []
+            for i, (p, stats) in enumerate(zip(parameters, statistics)):
+                runs = len(samples[i])
+                total = min(Replication.get_run_count(p, p["target-precision"].get_run_count(stats, runs, p["max-number-of-runs"])), p["max-number-of-runs"])
+                if total > runs:
+                    pending.append((i, range(runs, total)))
+                    Logger.log(LogLevel.INFO, "Target precision not reached after {} runs (ratio {:.2f}), adding {} runs.", runs, p["target-precision"].get_precision_ratio(stats), total - runs)
+                elif p["target-precision"].get_precision_ratio(stats) > 1.0:
+                    Logger.log(LogLevel.WARNING, "Target precision not reached, max-number-of-runs ({}) exhausted.", p["max-number-of-runs"])
 
-            # Output statistics to stdout for current sample:
-            print("{}\n{}\n{}".format("-" * 150, Statistics.get_as_string(self.__statistics.keys(), -1), "-" * 150))
+            if len(pending) == 0:
+                return statistics
 
-            # Wait until time to get next sample:
-            yield self.__environment.timeout(self.__parameters["sample-interval"])
+            [samples[i].extend(scenario_samples) for (i, _), scenario_samples in zip(pending, self.__execute_runs([(i, scenarios[i], runs) for i, runs in pending]))]
 
 
+    def __analyze_samples(self, lines):
+        """
+            Estimates autocorrelations of statistics of scenario (configuration <lines>) from a pilot run and logs
+            the smallest sample interval (for configured sample-time) and sample time (for configured sample-interval),
+            at which consecutive samples are effectively independent. Returns configuration lines of the scenario,
+            with recommended sample-time and sample-interval (the smallest for the recommended sample-time) if sample
+            analysis is applied. If no sample-time is recommended, only recommended sample-interval is applied (and
+            sample-time is raised to the length of batch, in which every statistic was observed in the pilot run).
+        """
+        parameters = SimulationParameters(lines, self.__supported_parameters)
+        if parameters["sample-analysis"] is SampleAnalysis.NONE:
+            return lines
+
+        Logger.log(LogLevel.INFO, "Starting pilot run of {} hours for sample analysis.", parameters["pilot-time"])
+        samples = Simulation._run_pilot(lines)
+        Logger.set_environment(self.__environment)
+
+        # Merge base batches, so that sparse statistics have observations in every batch:
+        size = get_observed_size(samples)
+        unobserved = [name for name, (_, counts) in samples.items() if not any(c != 0 for c in counts)]
+        if size is None or len(unobserved) != 0:
+            Logger.log(LogLevel.WARNING, "Sample analysis: statistics {} have too few observations in pilot run, consider longer pilot-time.",
+                       ", ".join(unobserved) if size is not None else "of some batches")
+        if size is None:
+            return lines
+        if size > 1:
+            Logger.log(LogLevel.INFO, "Sample analysis: base batches merged into batches of {} hours, so that every statistic has observations in each batch.", size * parameters["batch-base-time"])
+        samples = {name: merge_batches(values, counts, size) for name, (values, counts) in samples.items()}
+
+        base = parameters["batch-base-time"] * size
+        max_lag = len(next(iter(samples.values()))[0]) // 4
+        correlations = get_sample_correlations(samples, max_lag)
+        length, interval = max(1, round(parameters["sample-time"] / base)), parameters["sample-interval"] // base
+        gap = get_sample_spacing(correlations, length, parameters["sample-max-correlation"], max_lag)
+        minimum = get_sample_length(correlations, interval, parameters["sample-max-correlation"], max_lag)
+
+        if gap is None or minimum is None:
+            Logger.log(LogLevel.WARNING, "Sample analysis: correlation of samples does not fall below {} within {} hours, consider longer pilot-time.",
+                       parameters["sample-max-correlation"], max_lag * base)
+        if gap is not None:
+            Logger.log(LogLevel.INFO, "Sample analysis: samples of {} hours are effectively independent with sample-interval of at least {} hours.", length * base, gap * base)
+        if minimum is not None:
+            Logger.log(LogLevel.INFO, "Sample analysis: samples separated by {} hours are effectively independent with sample-time of at least {} hours.", interval * base, minimum * base)
+
+        if parameters["sample-analysis"] is not SampleAnalysis.APPLY or gap is None and minimum is None:
+            return lines
+        if minimum is None:
+            Logger.log(LogLevel.INFO, "Sample analysis: applying sample-interval of {} hours.", gap * base)
+            # Samples shorter than merged batch may be empty:
+            clamp = ["sample-time: {}\n".format(base)] if parameters["sample-time"] < base else []
+            return lines + ["\n", "sample-interval: {}\n".format(gap * base)] + clamp
+        # Recommended sample-time is independent at configured sample-interval, so the shortest sufficient interval is not longer:
+        gap = get_sample_spacing(correlations, minimum, parameters["sample-max-correlation"], interval)
+        Logger.log(LogLevel.INFO, "Sample analysis: applying sample-time of {} hours and sample-interval of {} hours.", minimum * base, gap * base)
+        return lines + ["\n", "sample-time: {}\n".format(minimum * base), "sample-interval: {}\n".format(gap * base)]
+
+
+    def __execute_runs(self, scenarios):
+        """
+            Executes simulation runs of all <scenarios> (tuples of scenario index, configuration lines
+            and run indices), either one after another or in parallel in a pool of worker processes.
+            Samples of each run are passed to results sink as soon as the run is completed. Runs found
+            in result cache are not simulated. Returns list of collected samples in order of runs for each scenario.
+        """
+        tasks = [(i, lines, r) for i, lines, runs in scenarios for r in runs]
+
+        # Restore runs completed by previous (interrupted) execution (written into recreated results sink again):
+        samples = [self.__manifest.get(self.__scenario_keys[i], r) for i, _, r in tasks]
+        [self.__sink.write(i, r, run_samples) for (i, _, r), run_samples in zip(tasks, samples) if run_samples is not None]
+        pending = [tasks[k] for k, run_samples in enumerate(samples) if run_samples is None]
+        if len(pending) != len(tasks):
+            Logger.log(LogLevel.INFO, "Restored {} completed simulation runs from job manifest.", len(tasks) - len(pending))
+
+        # Runs found in result cache are not simulated, simulated runs are sinked in order of completion:
+        cached = [self.__cache.get(self.__scenario_keys[i], r) for i, _, r in pending]
+        completed = [(k, run_samples) for k, run_samples in enumerate(cached) if run_samples is not None]
+        simulated = [k for k, run_samples in enumerate(cached) if run_samples is None]
+
+        workers = min(self.__parameters["number-of-workers"] or os.cpu_count(), len(simulated))
+        if workers <= 1:
+            results = ((k, Simulation._run_replication(*pending[k])) for k in simulated)
+            results = self.__sink_runs(pending, itertools.chain(completed, results))
+        else:
+            Logger.log(LogLevel.INFO, "Executing {} simulation runs of {} scenarios with {} worker processes.", len(simulated), len(scenarios), workers)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(Simulation._run_replication, *pending[k]): k for k in simulated}
+                results = ((futures[future], future.result()) for future in as_completed(futures))
+                results = self.__sink_runs(pending, itertools.chain(completed, results))
+        Logger.set_environment(self.__environment)
+        results = iter(results)
+        samples = [run_samples if run_samples is not None else next(results) for run_samples in samples]
+
+        # Group samples by scenario:
+        offsets = [sum(len(runs) for _, _, runs in scenarios[:i]) for i in range(len(scenarios) + 1)]
+        return [samples[offsets[i]:offsets[i + 1]] for i in range(len(scenarios))]
+
+
+    def __sink_runs(self, tasks, results):
+        """
+            Passes samples of completed runs (<results> are tuples of index into <tasks> and samples,
+            in order of completion) to job manifest, results sink and result cache. Run is recorded
+            into the manifest first, so that results sink can be rebuilt from the manifest on resume.
+            Returns list of samples in order of <tasks>.
+        """
+        samples = [None] * len(tasks)
+        for k, run_samples in results:
+            scenario, _, run = tasks[k]
+            self.__manifest.add(self.__scenario_keys[scenario], run, run_samples)
+            self.__sink.write(scenario, run, run_samples)
+            self.__cache.add(self.__scenario_keys[scenario], run, run_samples)
+            samples[k] = run_samples
+        return samples
+
+
+    def __merge_samples(self, parameters, samples):
+        """
+            Merges <samples> of all runs (in order of runs) into statistics of single scenario.
+        """
+        return Replication.merge_runs(parameters, Simulation._get_patient_types(parameters), samples)
+
+
+    @staticmethod
+    def _run_replication(scenario, lines, run):
+        """
+            Executes single simulation run <run> of scenario <scenario> with configuration parsed from <lines>.
+            NOTE: executed in worker processes, so everything is initialized from the configuration.
+        """
+        return Simulation._create_replication(lines, run, scenario=scenario).run()
+
+
+    @staticmethod
+    def _create_replication(lines, run, verbose=True, scenario=0):
+        """
+            Creates replication <run> of scenario <scenario> with configuration parsed from <lines> (logger is initialized too).
+        """
+        parameters = Simulation._parse_parameters(lines)
+        Simulation._initialize_logger(parameters, simpy.Environment())
+        return Replication(parameters, Simulation._get_patient_types(parameters), run, verbose=verbose, scenario=scenario)
+
+
+    @staticmethod
+    def _parse_parameters(lines):
+        """
+            Parses simulation parameters from configuration <lines>.
+        """
+        return SimulationParameters(lines, Simulation.__supported_parameters)
+
+
+    @staticmethod
+    def _run_pilot(lines):
+        """
+            Executes pilot run of sample analysis with configuration parsed from <lines>. Post warm-up period of
+            pilot-time hours is sampled into contiguous base batches. Returns samples of base batches.
+        """
+        parameters = SimulationParameters(lines, Simulation.__supported_parameters)
+        lines = lines + ["\n", "sampling: BATCH_MEANS\n", "sample-count: 1\n", "sample-time: {}\n".format(parameters["pilot-time"]),
+                         "event-trace: NONE\n", "patient-records: DROP_ON_EXIT\n", "profile: NONE\n"]
+        parameters = SimulationParameters(lines, Simulation.__supported_parameters)
+        Simulation._initialize_logger(parameters, simpy.Environment())
+        return Replication(parameters, Simulation._get_patient_types(parameters), Simulation.PILOT_RUN, merge=False).run()
+
+
+    @staticmethod
+    def _initialize_logger(parameters, environment):
+        """
+            Initializes logger with requested log level and output (first call only).
+        """
+        Logger(parameters["log-level"], environment, stdout=parameters["log-out"] & 10, file = parameters["result-folder"] / "log.log" if parameters["log-out"] & 12 else None, writer=parameters["log-writer"])
+
+
+    @staticmethod
+    def _get_scenario_key(parameters):
+        """
+            Returns key identifying <parameters> that affect samples of a single run (hash of normalized values).
+        """
+        values = ["{}: {}".format(name, parameters[name].name if isinstance(parameters[name], Enum) else repr(parameters[name]))
+                  for name in sorted(parameters) if name not in Simulation.__execution_parameters]
+        return hashlib.sha256("\n".join(values).encode()).hexdigest()[:32]
+
+
+    @staticmethod
+    def _get_patient_types(parameters):
+        """
+            Returns patient types. Default value is removed if user provided types exists, otherwise * is named to DEFAULT.
+        """
+        patient_types = parameters["patient-condition-*"]
+        if len(patient_types) > 1:
+            del patient_types["*"]
+        else:
+            patient_types["DEFAULT"] = patient_types.pop("*")
+        return patient_types
 
 
     def __parse_command_line_arguments(self):
@@ -209,30 +495,6 @@ class Simulation():
                             help='File containing parameters used in simulator.')
         parser.add_argument('--params', 
                             help='Print supported parameters.', action='store_true')
+        parser.add_argument('--resume', 
+                            help='Resume interrupted simulation: runs recorded in job manifest of result folder are not executed again.', action='store_true')
         return parser.parse_args()
-
-
-
-    def on_patient_status_changed(self, status, patient, time_stamp):
-        """
-            Callback to collect statistics when patient status is changed.
-        """
-
-        if status == PatientStatus.WAITING:
-            self.__arrival_queue.append(patient)
-        elif status == PatientStatus.IN_PREPARATION:
-            self.__arrival_queue.remove(patient)
-        elif status == PatientStatus.PREPARED:
-            Statistics.update_sample("number_of_prepared")
-        elif status == PatientStatus.OPERATED:
-            Statistics.update_sample("number_of_operated")
-            #StatisticsCollection.update_statistic("rate-blocking-operations", [time_stamp,  1 if self.__recovery.resources.capacity == self.__recovery.resources.count  else 0])
-            Statistics.update_sample("rate-blocking-operations", 100.0 if self.__recovery.resources.capacity == self.__recovery.resources.count  else 0)
-        elif status == PatientStatus.RECOVERED:
-            Statistics.update_sample("mean_time_per_prepare", patient.time_stamps[PatientStatus.PREPARED] - patient.time_stamps[PatientStatus.WAITING])
-            Statistics.update_sample("mean_time_per_operate", patient.time_stamps[PatientStatus.OPERATED] - patient.time_stamps[PatientStatus.PREPARED])
-            Statistics.update_sample("mean_time_per_patient", patient.time_stamps[PatientStatus.RECOVERED] - patient.time_stamps[PatientStatus.WAITING])
-            Statistics.update_sample("number_of_recovered")
-        elif status == PatientStatus.DECEASED:
-            Statistics.update_sample("number_of_deceased")
-
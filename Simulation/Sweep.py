@@ -0,0 +1,90 @@
+from itertools import product
+import ast
+
+"""
+    Sweep module
+
+    SweepGrid expands single base configuration into multiple scenarios. Sweep is given as
+    dictionary of parameter names and lists of values, for example:
+
+        sweep: {"number-of-preparation-units": [3, 4], "number-of-recovery-units": [4, 5]}
+
+    , where every combination of values (Cartesian product) is a scenario of its own.
+    Scenario is created by appending swept values to the base configuration, so that
+    they override values of the base configuration.
+
+"""
+
+class SweepGrid:
+    """
+        Class for parsing and storing user provided parameter sweep.
+    """
+    def __init__(self, string):
+        self.grid = ast.literal_eval(string)
+        if not isinstance(self.grid, dict) or not all(isinstance(v, list) and len(v) != 0 for v in self.grid.values()):
+            raise ValueError("Sweep should be a dictionary of non-empty lists.")
+
+
+    def __repr__(self):
+        return repr(self.grid)
+
+
+    def __len__(self):
+        return len(self.grid)
+
+
+    def get_scenarios(self, lines):
+        """
+            Expands Cartesian product of swept values into scenarios. Returns list of tuples of
+            swept values (by parameter name) and configuration <lines> of the scenario.
+        """
+        names = list(self.grid.keys())
+        scenarios = []
+        for values in product(*self.grid.values()):
+            overrides = ["{}: {}\n".format(name, SweepGrid.__as_parameter_value(value)) for name, value in zip(names, values)]
+            scenarios.append((dict(zip(names, values)), lines + ["\n"] + overrides + ["sweep: {}\n"]))
+        return scenarios
+
+
+    @staticmethod
+    def __as_parameter_value(value):
+        """
+            Converts swept <value> into parameter value string. Strings are used as they are (e.g. enums),
+            other values are converted to their literal representation.
+        """
+        return value if isinstance(value, str) else repr(value)
+
+
+    @staticmethod
+    def get_as_csv(scenarios, statistics, decimal_delimeter=","):
+        """
+            Returns single csv table with one row per scenario. Row contains swept values of the
+            scenario followed by mean and confidence interval of each statistic.
+        """
+        names = list(dict.fromkeys(name for stats in statistics for name in stats.keys()))
+        parameters = list(dict.fromkeys(name for values in scenarios for name in values.keys()))
+        titles = ["scenario"] + parameters
+        for name in names:
+            stat = next(stats[name] for stats in statistics if name in stats)
+            titles += ["{}({})".format(stat.title_short, stat.unit), "{}_ci({})".format(stat.title_short, stat.unit)]
+
+        rows = []
+        for i, (values, stats) in enumerate(zip(scenarios, statistics)):
+            row = [str(i)] + [SweepGrid.__as_parameter_value(values.get(p, "")) for p in parameters]
+            for name in names:
+                mean, interval = SweepGrid.__get_estimate(stats[name]) if name in stats else (float('nan'), float('nan'))
+                row += [str(mean).replace(".", decimal_delimeter), str(interval).replace(".", decimal_delimeter)]
+            rows.append(row)
+
+        return "SEP=;\n" + ";".join(titles) + "\n" + "\n".join([";".join(r) for r in rows])
+
+
+    @staticmethod
+    def __get_estimate(stat):
+        """
+            Returns mean and confidence interval of <stat> (NaN if not enough samples).
+        """
+        try:
+            return stat.get_mean(), stat.get_confidence_interval()
+        except (ZeroDivisionError, ValueError):
+            return float('nan'), float('nan')
@@ -0,0 +1,349 @@
+from Simulation.Patients import PatientStatus
+from Core.Logging.Logging import SimLogger as Logger, LogLevel
+from Core.Statistics.Statistics import *
+from Core.Exceptions import SimulationException
+from enum import IntEnum
+from array import array
+import struct
+import json
+import mmap
+import sys
+
+"""
+    Trace module
+
+    Binary event trace of a single replication. Every patient status transition is
+    recorded as (time, id, priority, status, condition) and written into trace file
+    in chunks. Changes of used units are recorded as transitions too, with status
+    UNITS_PREPARATION, UNITS_OPERATION or UNITS_RECOVERY and number of used units as
+    id (units are not released on status changes only, see Phases module). Within a
+    chunk records are stored column by column:
+
+        header:  magic (8 bytes) | length of metadata (uint64) | metadata (json) | padding
+                 (header is padded to at least HEADER_SIZE bytes, so that metadata can be
+                 updated when trace is closed)
+        chunk:   number of records n (uint64) | time (n x float64) | id (n x int64) |
+                 priority (n x float64) | status (n x uint8) | condition (n x uint8) | padding
+
+    Chunks are aligned to 8 bytes, so that TraceReader can expose columns of memory
+    mapped file as typed memoryviews without copying. Metadata holds parameters needed
+    to recompute statistics (unit counts, sampling and names of conditions).
+
+    TraceReplay recomputes statistics of a replication from its trace, optionally with
+    different sampling (warm-up, interval, time, count). Statistics based on drawn
+    service times (mean-in-*-time) are not part of the trace and are not replayed.
+
+"""
+
+class EventTrace(IntEnum):
+    """
+        Supported event trace outputs.
+    """
+    NONE   = 0
+    BINARY = 1
+
+
+# Pseudo statuses for changes of used units (preparation, operation, recovery):
+UNITS_PREPARATION = len(PatientStatus)
+UNITS_OPERATION   = UNITS_PREPARATION + 1
+UNITS_RECOVERY    = UNITS_PREPARATION + 2
+
+_MAGIC = b"SRTRACE2"
+_HEADER_SIZE = 4096
+_COLUMNS = (("time", "d"), ("id", "q"), ("priority", "d"), ("status", "B"), ("condition", "B"))
+
+
+def _padding(size):
+    return b"\0" * (-size % 8)
+
+
+def _header_padding(length):
+    """
+        Returns padding after metadata of <length> bytes.
+    """
+    size = len(_MAGIC) + 8 + length
+    return b"\0" * max(_HEADER_SIZE - size, -size % 8)
+
+
+class TraceRecorder:
+    """
+        Records patient status transitions into binary trace file <path>.
+    """
+    CHUNK_SIZE = 65536
+
+    def __init__(self, path, metadata):
+        """
+            Creates trace file <path> and writes <metadata> (dictionary) into its header.
+        """
+        self.__metadata = dict(metadata, byteorder=sys.byteorder)
+        self.__file = open(path, "wb")
+        self.__write_header()
+        self.__conditions = {name: i for i, name in enumerate(metadata["conditions"])}
+        self.__columns = [array(code) for _, code in _COLUMNS]
+
+
+    def record(self, status, patient, time_stamp):
+        """
+            Records single status transition of <patient>.
+        """
+        time, id, priority, status_, condition = self.__columns
+        time.append(time_stamp)
+        id.append(patient.id)
+        priority.append(patient.priority)
+        status_.append(status)
+        condition.append(self.__conditions.get(patient.condition, 0))
+        if len(time) == TraceRecorder.CHUNK_SIZE:
+            self.flush()
+
+
+    def record_units(self, status, count, time_stamp):
+        """
+            Records change of used units to <count>, <status> is one of UNITS_* statuses.
+        """
+        time, id, priority, status_, condition = self.__columns
+        time.append(time_stamp)
+        id.append(count)
+        priority.append(0)
+        status_.append(status)
+        condition.append(0)
+        if len(time) == TraceRecorder.CHUNK_SIZE:
+            self.flush()
+
+
+    def flush(self):
+        """
+            Appends recorded transitions as a new chunk into trace file.
+        """
+        if len(self.__columns[0]) != 0:
+            self.__file.write(struct.pack("<Q", len(self.__columns[0])))
+            size = 0
+            for column in self.__columns:
+                column.tofile(self.__file)
+                size += column.itemsize * len(column)
+            self.__file.write(_padding(size))
+            self.__columns = [array(code) for _, code in _COLUMNS]
+
+
+    def close(self, metadata={}):
+        """
+            Writes remaining transitions and closes trace file. Header is updated with <metadata>
+            (e.g. values known only at the end of simulation).
+        """
+        self.flush()
+        if len(metadata) != 0:
+            size = self.__file.tell()
+            self.__metadata.update(metadata)
+            self.__file.seek(0)
+            self.__write_header(len(_MAGIC) + 8 + self.__header_length + len(_header_padding(self.__header_length)))
+            self.__file.seek(size)
+        self.__file.close()
+
+
+    def __write_header(self, reserved=None):
+        """
+            Writes header with metadata. Header must fit into <reserved> bytes (if given).
+        """
+        header = json.dumps(self.__metadata).encode()
+        if reserved is not None and len(_MAGIC) + 8 + len(header) + len(_header_padding(len(header))) != reserved:
+            raise SimulationException("Metadata of event trace does not fit into its header.")
+        self.__header_length = len(header)
+        self.__file.write(_MAGIC + struct.pack("<Q", len(header)) + header + _header_padding(len(header)))
+
+
+
+class TraceReader:
+    """
+        Reads binary trace file <path> through memory mapping.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.__map[:len(_MAGIC)] != _MAGIC:
+            raise SimulationException("File '{}' is not an event trace.".format(path))
+
+        length = struct.unpack_from("<Q", self.__map, len(_MAGIC))[0]
+        offset = len(_MAGIC) + 8
+        self.metadata = json.loads(self.__map[offset:offset + length].decode())
+        if self.metadata["byteorder"] != sys.byteorder:
+            raise SimulationException("Event trace '{}' is recorded with different byte order.".format(path))
+
+        # Locate chunks (offset of the first column and number of records):
+        self.__chunks = []
+        offset += length + len(_header_padding(length))
+        while offset < len(self.__map):
+            count = struct.unpack_from("<Q", self.__map, offset)[0]
+            self.__chunks.append((offset + 8, count))
+            size = sum(array(code).itemsize * count for _, code in _COLUMNS)
+            offset += 8 + size + len(_padding(size))
+
+
+    def __len__(self):
+        return sum(count for _, count in self.__chunks)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def chunks(self):
+        """
+            Yields columns of each chunk as dictionary of typed memoryviews (no copies).
+        """
+        view = memoryview(self.__map)
+        for offset, count in self.__chunks:
+            columns = {}
+            for name, code in _COLUMNS:
+                size = array(code).itemsize * count
+                columns[name] = view[offset:offset + size].cast(code)
+                offset += size
+            yield columns
+
+
+    def column(self, name):
+        """
+            Returns single column <name> of all chunks as an array.
+        """
+        values = array(dict(_COLUMNS)[name])
+        [values.frombytes(columns[name]) for columns in self.chunks()]
+        return values
+
+
+    def close(self):
+        try:
+            self.__map.close()
+        except BufferError:
+            pass
+
+
+
+class TraceReplay:
+    """
+        Recomputes statistics of single replication from its event trace.
+    """
+    NOT_REPLAYED = ("mean-in-preparation-time", "mean-in-operation-time", "mean-in-recovery-time")
+
+    def __init__(self, reader, **sampling):
+        """
+            Creates replay of trace <reader>. Sampling parameters of the trace can be overridden
+            by <sampling> (e.g. sample_warm_up=500).
+        """
+        self.__reader = reader
+        self.__sampling = {p: sampling.get(p.replace("-", "_")) if sampling.get(p.replace("-", "_")) is not None else reader.metadata[p]
+                           for p in ("sample-warm-up", "sample-interval", "sample-time", "sample-count")}
+
+
+    def get_boundaries(self):
+        """
+            Returns list of sample boundaries (time, starts new sample) limited by length of the trace.
+        """
+        warm_up, interval, time, count = (self.__sampling[p] for p in ("sample-warm-up", "sample-interval", "sample-time", "sample-count"))
+        end = self.__reader.metadata["simulation-time"]
+        boundaries = []
+        for i in range(count):
+            start = warm_up + i * (interval + time)
+            if start + time > end:
+                Logger.log(LogLevel.WARNING, "Event trace ends at {}, only {} samples are replayed.", end, i)
+                break
+            boundaries += [(start, True), (start + time, False)]
+        return boundaries
+
+
+    def run(self, statistics):
+        """
+            Replays trace into <statistics> (dictionary of empty sample collections by name).
+            Returns collected samples of each statistic by statistic name.
+        """
+        statistics = {name: stat for name, stat in statistics.items() if name not in TraceReplay.NOT_REPLAYED}
+        Statistics()
+        Statistics.clear()
+        [Statistics.add_statistic(name, stat) for name, stat in statistics.items()]
+
+        conditions = self.__reader.metadata["conditions"]
+        capacities = self.__reader.metadata["units"]
+        boundaries = self.get_boundaries()
+        end = boundaries[-1][0] if boundaries else 0.0
+
+        # Units in use (preparation, operation, recovery), arrival queue and active patients:
+        units = [0, 0, 0]
+        queue = 0
+        patients = {}
+        last_arrival = None
+        levels = {
+            UNITS_PREPARATION: lambda time: Statistics.update_sample("idle-capacity-preparation", capacities[0] - units[0], time),
+            UNITS_OPERATION:   lambda time: Statistics.update_sample("usage_of_operation_unit", units[1] / capacities[1] * 100.0, time),
+            UNITS_RECOVERY:    lambda time: Statistics.update_sample("all-recovery-units-busy", 100.0 if capacities[2] == units[2] else 0, time)
+        }
+
+        def update_levels(time):
+            [update(time) for update in levels.values()]
+            Statistics.update_sample("arrival-queue-length", queue, time)
+
+        boundary = 0
+        for columns in self.__reader.chunks():
+            for time, id, status, condition in zip(columns["time"], columns["id"], columns["status"], columns["condition"]):
+                if time >= end:
+                    break
+                while boundary < len(boundaries) and time >= boundaries[boundary][0]:
+                    TraceReplay.__sample_boundary(boundaries[boundary], update_levels)
+                    boundary += 1
+
+                if status >= UNITS_PREPARATION:
+                    units[status - UNITS_PREPARATION] = id
+                    levels[status](time)
+                elif status == PatientStatus.WAITING:
+                    if last_arrival is not None:
+                        Statistics.update_sample("patient-generator-interval", time - last_arrival)
+                    last_arrival = time
+                    [Statistics.update_sample("patient-portion-" + k, 100.0 if i == condition else 0.0) for i, k in enumerate(conditions)]
+                    Statistics.update_sample("total-number-of-patients")
+                    patients[id] = [time, 0.0, 0.0]
+                    queue += 1
+                    Statistics.update_sample("arrival-queue-length", queue, time)
+                elif status == PatientStatus.IN_PREPARATION:
+                    queue -= 1
+                    Statistics.update_sample("arrival-queue-length", queue, time)
+                elif status == PatientStatus.PREPARED:
+                    patients[id][1] = time
+                    Statistics.update_sample("number_of_prepared")
+                elif status == PatientStatus.OPERATED:
+                    patients[id][2] = time
+                    Statistics.update_sample("number_of_operated")
+                    Statistics.update_sample("rate-blocking-operations", 100.0 if capacities[2] == units[2] else 0)
+                elif status == PatientStatus.RECOVERED:
+                    waiting, prepared, operated = patients.pop(id)
+                    Statistics.update_sample("mean_time_per_prepare", prepared - waiting)
+                    Statistics.update_sample("mean_time_per_operate", operated - prepared)
+                    Statistics.update_sample("mean_time_per_patient", time - waiting)
+                    Statistics.update_sample("number_of_recovered")
+                elif status == PatientStatus.DECEASED:
+                    del patients[id]
+                    Statistics.update_sample("number_of_deceased")
+            else:
+                continue
+            break
+
+        # Close remaining samples:
+        while boundary < len(boundaries):
+            TraceReplay.__sample_boundary(boundaries[boundary], update_levels)
+            boundary += 1
+
+        return {name: stat.get_samples() for name, stat in statistics.items()}
+
+
+    @staticmethod
+    def __sample_boundary(boundary, update_levels):
+        """
+            Starts or ends sample at <boundary> (time, starts new sample).
+        """
+        time, start = boundary
+        if start:
+            Statistics.start_sample()
+            update_levels(time)
+        else:
+            update_levels(time)
+            Statistics.end_sample()
@@ -0,0 +1,160 @@
+from pathlib import Path
+import contextlib
+import subprocess
+import argparse
+import tempfile
+import json
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+"""
+    Performance benchmark of the simulator. Runs fixed matrix of workloads (configurations of
+    Examples/Assignments/A3 and synthetic high-load and large-capacity configurations of Benchmarks
+    folder, with both simulation engines), each single run in a fresh interpreter, and measures:
+
+    - patients per second (patients generated during the run / wall time of the run)
+    - events per second (events processed by simulation engine / wall time of the run)
+    - peak RSS of the worker process (MB)
+    - startup time (interpreter start and imports, 'python main.py --params')
+
+    Results are compared with baselines (Benchmarks/baseline.json by default). Decrease of
+    throughput or increase of peak RSS or startup time beyond tolerance is reported as regression
+    (exit code 1). Baselines depend on the machine, record them before changing the code:
+
+    python benchmark.py --update-baseline
+    python benchmark.py --tolerance 0.1
+
+"""
+
+ROOT = Path(__file__).resolve().parent
+
+# Workloads: name, configuration file and lines overriding the configuration:
+WORKLOADS = [
+    *[(path.stem, path, []) for path in sorted((ROOT / "Examples" / "Assignments" / "A3").glob("*.txt"))],
+    ("high-load",          ROOT / "Benchmarks" / "high-load.txt",      []),
+    ("high-load-heap",     ROOT / "Benchmarks" / "high-load.txt",      ["simulation-engine: HEAP\n"]),
+    ("large-capacity",     ROOT / "Benchmarks" / "large-capacity.txt", []),
+    ("large-capacity-heap", ROOT / "Benchmarks" / "large-capacity.txt", ["simulation-engine: HEAP\n"]),
+]
+
+# Metrics: name, True if larger value is better:
+METRICS = [("patients-per-second", True), ("events-per-second", True), ("peak-rss", False), ("startup", False)]
+
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Runs performance benchmarks and compares results with baselines.')
+    parser.add_argument('--baseline', type=Path, default=ROOT / "Benchmarks" / "baseline.json", help='Baseline file.')
+    parser.add_argument('--update-baseline', action='store_true', help='Store results as new baselines.')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Accepted relative change before regression is reported.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repetitions of each workload (best result is used).')
+    parser.add_argument('--filter', default="", help='Run only workloads whose name contains given text.')
+    parser.add_argument('--worker', nargs=2, metavar=('CONF', 'OVERRIDES'), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_worker(path, overrides):
+    """
+        Executes single run of configuration <path> with <overrides> (json list of lines) in this process
+        and prints measurements as json.
+    """
+    sys.path.insert(0, str(ROOT))
+    from Simulation.Simulation import Simulation
+    from Simulation.Patients import PatientRecords
+
+    with open(path) as file:
+        lines = file.readlines()
+    with tempfile.TemporaryDirectory() as folder:
+        lines += ["\n", "log-level: CRITICAL\n", "log-out: LOG_NONE\n", "number-of-runs: 1\n", "event-trace: NONE\n",
+                  "results-sink: NONE\n", "result-folder: {}\n".format(folder)] + json.loads(overrides)
+
+        replication = Simulation._create_replication(lines, 0)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            replication.run()
+            wall = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes (bytes on macOS):
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.0 if sys.platform != "darwin" else 1024.0 ** 2) if resource is not None else float('nan')
+    print(json.dumps({"wall": wall, "patients": PatientRecords._NEXT_ID, "events": replication.get_event_count(), "peak-rss": rss}))
+
+
+def measure_workload(path, overrides, repeat):
+    """
+        Runs workload <repeat> times in fresh interpreters. Returns metrics of the fastest run.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, __file__, "--worker", str(path), json.dumps(overrides)], check=True, capture_output=True, text=True, cwd=ROOT).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    best = min(runs, key=lambda r: r["wall"])
+    return {"patients-per-second": best["patients"] / best["wall"], "events-per-second": best["events"] / best["wall"], "peak-rss": min(r["peak-rss"] for r in runs)}
+
+
+def measure_startup(repeat):
+    """
+        Returns the shortest wall time of starting the simulator (interpreter start, imports and parameter listing).
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(ROOT / "main.py"), "--params"], check=True, stdout=subprocess.DEVNULL, cwd=ROOT)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare(results, baselines, tolerance):
+    """
+        Returns list of regressions (workload, metric, baseline value, current value).
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric, larger_is_better in METRICS:
+            if metric not in metrics or metric not in baselines.get(name, {}):
+                continue
+            baseline, value = baselines[name][metric], metrics[metric]
+            if baseline <= 0:
+                continue
+            change = (baseline - value) / baseline if larger_is_better else (value - baseline) / baseline
+            if change > tolerance:
+                regressions.append((name, metric, baseline, value))
+    return regressions
+
+
+def main():
+    args = parse_command_line_arguments()
+    if args.worker is not None:
+        run_worker(*args.worker)
+        return
+
+    results = {}
+    startup = measure_startup(args.repeat)
+    for name, path, overrides in WORKLOADS:
+        if args.filter in name:
+            results[name] = dict(measure_workload(path, overrides, args.repeat), startup=startup)
+            print("{:25} {:>12.0f} patients/s {:>12.0f} events/s {:>8.1f} MB {:>6.3f} s startup".format(name, *(results[name][m] for m, _ in METRICS)))
+
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({**baselines, **results}, indent=4) + "\n")
+        print("Baselines written to {}.".format(args.baseline))
+        return
+    if len(baselines) == 0:
+        print("No baselines found, record them with --update-baseline.")
+        return
+
+    regressions = compare(results, baselines, args.tolerance)
+    for name, metric, baseline, value in regressions:
+        print("REGRESSION {:25} {:20} baseline {:.3f}, now {:.3f}".format(name, metric, baseline, value))
+    if len(regressions) != 0:
+        sys.exit(1)
+    print("No regressions beyond tolerance of {:.0%}.".format(args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,8 @@ def main():
 
 """
 
-    TODO: Add simulator multi dispatcher (not funny to manyally change configuration file for each simulation).
+    Multiple scenarios can be simulated with single configuration file by using 'sweep'
+    parameter, see chapter 1.4.
 
     
     -----------------------------------------------------------------------------------------
@@ -46,6 +47,10 @@ def main():
     StatisticsCollection.add_statistic(<Statistic>, <StatisticName>)
     StatisticsCollection.update_statistic(<StatisticName>)
     StatisticsCollection.output_statistic(<StatisticName>, <StatisticsOutput>)
+
+    Output analysis (warm-up detection) is in Analysis module and streaming of
+    samples into files (results sinks) in Sinks module. Profiling of simulation runs
+    (cProfile, tracemalloc) is in Core/Profiling module.
     
     
     -----------------------------------------------------------------------------------------
@@ -59,7 +64,24 @@ def main():
 
     Phases
     Patients
+    EventCalendar (binary-heap engine, selected by 'simulation-engine: HEAP')
+    Replication (single simulation run)
+    Sweep (expands 'sweep' parameter into scenarios)
+    Estimator (analytic estimates of scenarios, used by 'sweep-filter')
+    Optimizer (search for the cheapest unit configuration, 'optimization-constraints')
+    Trace (binary event trace of patient transitions, replayed by replay.py)
+    Cache (on-disk cache of samples of completed runs, 'result-cache')
     Simulation (main script)
+    Context (per-simulation state of singletons, for in-process simulations)
+    Api (in-process interface: simulate(<parameters>) returns results as objects)
+    Server (job server with warm worker pool and result streaming, started by server.py)
+
+    Simulation runs (and scenarios of a sweep) can be executed in parallel by setting
+    'number-of-workers' parameter. Example of a sweep over unit counts:
+
+    sweep: {"number-of-preparation-units": [3, 4], "number-of-recovery-units": [4, 5]}
+
+    Statistics of all scenarios are written into single sweep_statistics.csv file.
 
     
     -----------------------------------------------------------------------------------------
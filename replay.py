@@ -0,0 +1,58 @@
+from Simulation.Replication import Replication
+from Simulation.Trace import TraceReader, TraceReplay
+from Simulation.EventCalendar import EventCalendar
+from Core.Logging.Logging import SimLogger as Logger, LogLevel
+from Core.Statistics.Statistics import *
+from Core.Exceptions import SimulationException
+import argparse
+
+"""
+    Recomputes statistics from event traces (trace_<scenario>_<run>.bin) recorded with 'event-trace: BINARY'.
+    Sampling of the recorded simulation can be overridden, e.g. to try different warm-up:
+
+    python replay.py --sample-warm-up 2000 --csv replayed.csv result/trace_0_*.bin
+
+    All traces must be runs of the same scenario.
+
+"""
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Recomputes statistics from event traces (one trace per simulation run).')
+    parser.add_argument('traces', nargs='+', help='Event trace files.')
+    parser.add_argument('--sample-warm-up', type=float, help='Time in hours before first sample is taken.')
+    parser.add_argument('--sample-interval', type=float, help='Timeout in hours between single samples.')
+    parser.add_argument('--sample-time', type=float, help='Length of single sample in hours.')
+    parser.add_argument('--sample-count', type=int, help='Number of samples per run.')
+    parser.add_argument('--csv', help='Write samples of all runs into csv file.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_command_line_arguments()
+    sampling = {k: v for k, v in vars(args).items() if k.startswith("sample_")}
+    Logger(LogLevel.WARNING, EventCalendar())
+    try:
+        statistics, scenario = None, None
+        for path in args.traces:
+            with TraceReader(path) as reader:
+                if scenario is not None and reader.metadata.get("scenario", 0) != scenario:
+                    raise SimulationException("Trace {} is not a run of scenario {}, replay traces of one scenario only.".format(path, scenario))
+                scenario = reader.metadata.get("scenario", 0)
+                patient_types = dict.fromkeys(reader.metadata["conditions"])
+                samples = TraceReplay(reader, **sampling).run(Replication.create_statistics(patient_types))
+            if statistics is None:
+                statistics = {name: stat for name, stat in Replication.create_statistics(patient_types).items() if name in samples}
+            [stat.extend(samples[name]) for name, stat in statistics.items()]
+
+        Statistics.clear()
+        [Statistics.add_statistic(name, stat) for name, stat in statistics.items()]
+        print(Statistics.get_as_string(statistics.keys()))
+        if args.csv is not None:
+            with open(args.csv, 'w') as file:
+                file.write(Statistics.get_as_csv(statistics.keys()) + "\n")
+    except SimulationException as e:
+        print(e)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from Simulation.Server import JobServer, submit
+from Core.Exceptions import SimulationException
+import argparse
+import asyncio
+import json
+
+"""
+    Local job server with a pool of warm worker processes (see Simulation/Server.py).
+    Start the server and submit configuration files to it from other terminals:
+
+    python server.py --socket /tmp/surgery.sock --workers 4
+    python server.py --socket /tmp/surgery.sock --submit Examples/example-configuration.txt
+
+    Submitted jobs stream accepted, sample, run and result messages (JSON lines) to stdout.
+
+"""
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Runs job server or submits configuration to it.')
+    parser.add_argument('--socket', default="surgery-simulation.sock", help='Unix socket of the server.')
+    parser.add_argument('--port', type=int, help='Local TCP port of the server (instead of Unix socket).')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (number of CPUs by default).')
+    parser.add_argument('--submit', type=argparse.FileType('r'), help='Submit configuration file to running server.')
+    parser.add_argument('--set', nargs=2, action='append', default=[], metavar=('NAME', 'VALUE'), help='Parameter overriding the configuration of submitted job.')
+    return parser.parse_args()
+
+
+async def submit_job(args):
+    configuration = args.submit.read()
+    args.submit.close()
+    async for message in submit(configuration, dict(args.set), path=args.socket, port=args.port):
+        print(json.dumps(message), flush=True)
+
+
+def main():
+    args = parse_command_line_arguments()
+    try:
+        if args.submit is not None:
+            asyncio.run(submit_job(args))
+        else:
+            asyncio.run(JobServer(args.workers).serve(args.socket, args.port))
+    except SimulationException as e:
+        print(e)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()